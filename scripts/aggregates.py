@@ -0,0 +1,242 @@
+import os
+import json
+import logging
+import pandas as pd
+from collections import namedtuple
+
+from data_loader import CLEAN_DATASET, DATE_COLUMN, dataset_version
+from query import query_positions
+from sales_cube import rollup_cube
+
+logger = logging.getLogger(__name__)
+
+# Directory of the aggregate tables written by data_preprocessing.py, and their manifest:
+AGGREGATES_DIR = "../datasets/aggregates"
+MANIFEST_FILE = "manifest.json"
+
+# Aggregate tables materialized for the standard views of the dashboard (every date, filtered by
+# month and team only): {name: (dimensions, measure)}. Each chart rolls one of them up to its own
+# dimensions, so the dimensions of a table are the union of the ones of its charts plus the filters.
+AGGREGATE_TABLES = {
+    # Charts 1 and 2, indicators 1, 2 and 3, charts 5 and 6 (consultants' ranking and teams' sales):
+    'sales_by_consultant': (['Mês', 'Equipe', 'Consultor'], 'Valor Pago'),
+    # Charts 7 and 8 (sales by channel):
+    'sales_by_channel': (['Mês', 'Equipe', 'Meio de Propaganda'], 'Valor Pago'),
+    # Charts 3 and 4 (calls by day and by month):
+    'calls_by_day': (['Mês', 'Equipe', 'Dia'], 'Chamadas Realizadas'),
+}
+
+# Columns whose distinct values are listed by the filters of the layout:
+OPTION_COLUMNS = ['Equipe', 'Meio de Propaganda']
+
+# Tables of one version of the dataset, loaded from the manifest (each table is stored as one or more
+# segments, written by write_aggregates and append_aggregates, merged when loaded):
+#     version: version of the cleaned dataset the tables were built from (see data_loader.dataset_version);
+#     tables: {name: (dimensions, measure, dataframe)};
+#     values: {column: distinct values, in order of appearance within the dataset};
+#     first_date: first date of the dataset.
+Aggregates = namedtuple('Aggregates', ['version', 'tables', 'values', 'first_date'])
+
+
+def build_aggregates(cube, tables=AGGREGATE_TABLES):
+    """
+    Rolls the sales cube up to the aggregate tables.
+    :param cube: Cube returned by build_sales_cube.
+    :param tables: Dict of {name: (dimensions, measure)}.
+    :return: Dict of {name: dataframe}.
+    """
+    return {name: rollup_cube(cube, dims, value).reset_index() for name, (dims, value) in tables.items()}
+
+
+def add_option_values(values, df):
+    """
+    Adds the values of the filters not listed yet, in order of appearance within the rows.
+    :param values: Dict of {column: distinct values}, updated in place.
+    :param df: Cleaned rows.
+    :return: The updated dict.
+    """
+    for col in OPTION_COLUMNS:
+        values[col] += [v for v in df[col].unique() if v not in values[col]]
+    return values
+
+
+def _write_manifest(manifest, path):
+    # The manifest is replaced in a single step, after every table it lists is written:
+    tmp_path = os.path.join(path, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST_FILE))
+
+
+def _write_segments(manifest, cube, path):
+    # Writes the tables rolled up from a cube as new segments, named after the version of the dataset:
+    for name, df in build_aggregates(cube).items():
+        dims, value = AGGREGATE_TABLES[name]
+        table = manifest['tables'].setdefault(name, {'files': [], 'dimensions': dims, 'measure': value, 'rows': 0})
+        if len(df) or not table['files']:
+            file = f"{name}-{manifest['version']}.csv"
+            df.to_csv(os.path.join(path, file), index=False)
+            table['files'].append(file)
+            table['rows'] += len(df)
+
+
+def write_aggregates(cube, csv_path=CLEAN_DATASET, path=AGGREGATES_DIR, chunksize=500_000):
+    """
+    Writes the aggregate tables of the cleaned dataset and their manifest. The file names carry the
+    version of the dataset, and the manifest is replaced last: readers see either the previous
+    version of every table or the new one. Files of the previous versions are removed afterwards.
+    :param cube: Cube of the cleaned dataset, in sync with it.
+    :param csv_path: Path of the cleaned dataset.
+    :param path: Directory of the aggregate tables.
+    :param chunksize: Number of rows read at a time when listing the values of the filters.
+    :return: Manifest written.
+    """
+    try:
+        os.makedirs(path, exist_ok=True)
+
+        manifest = {'version': dataset_version(csv_path), 'first_date': None, 'tables': {}}
+        if len(cube):
+            manifest['first_date'] = str(cube[DATE_COLUMN].min().date())
+        _write_segments(manifest, cube, path)
+
+        # Values of the filters in order of appearance (the cube is sorted by date, not by appearance):
+        values = {col: [] for col in OPTION_COLUMNS}
+        for chunk in pd.read_csv(csv_path, usecols=OPTION_COLUMNS, chunksize=chunksize):
+            add_option_values(values, chunk)
+        manifest['values'] = values
+
+        _write_manifest(manifest, path)
+
+        # Remove the tables of the previous versions:
+        current = {file for table in manifest['tables'].values() for file in table['files']}
+        for file in os.listdir(path):
+            if file.endswith('.csv') and file not in current:
+                os.remove(os.path.join(path, file))
+
+        return manifest
+
+    except Exception as e:
+        logger.error(f"Error while writing the aggregate tables: {str(e)}")
+        raise
+
+
+def append_aggregates(cube, values, csv_path=CLEAN_DATASET, path=AGGREGATES_DIR):
+    """
+    Adds the totals of new rows to the aggregate tables, once they are appended to the cleaned
+    dataset. The tables of the delta are written as new segments, listed by the manifest with the
+    previous ones and merged when loaded: the stored segments are neither read nor rewritten, so
+    the cost depends only on the size of the delta. The next write_aggregates (full preprocessing)
+    writes every table as a single segment again.
+    :param cube: Cube of the new rows only (see sales_cube.merge_sales_cubes).
+    :param values: Values of the filters within the new rows (see add_option_values).
+    :param csv_path: Path of the cleaned dataset, with the new rows appended.
+    :param path: Directory of the aggregate tables, current before the new rows were appended.
+    :return: Manifest written.
+    """
+    try:
+        manifest = read_manifest(path)
+        manifest['version'] = dataset_version(csv_path)
+        if len(cube):
+            first_date = str(cube[DATE_COLUMN].min().date())
+            manifest['first_date'] = min(filter(None, (manifest['first_date'], first_date)))
+            _write_segments(manifest, cube, path)
+
+        for col, new_values in values.items():
+            manifest['values'][col] += [v for v in new_values if v not in manifest['values'][col]]
+
+        _write_manifest(manifest, path)
+
+        return manifest
+
+    except Exception as e:
+        logger.error(f"Error while appending to the aggregate tables: {str(e)}")
+        raise
+
+
+def read_manifest(path=AGGREGATES_DIR):
+    """
+    Reads the manifest of the aggregate tables.
+    :param path: Directory of the aggregate tables.
+    :return: Manifest, or None when there is none.
+    """
+    manifest_path = os.path.join(path, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def is_current(path=AGGREGATES_DIR, csv_path=CLEAN_DATASET):
+    """
+    Checks whether the aggregate tables were built from the current version of the cleaned dataset.
+    :param path: Directory of the aggregate tables.
+    :param csv_path: Path of the cleaned dataset.
+    :return: True when the manifest exists and carries the version of the dataset.
+    """
+    manifest = read_manifest(path)
+    return manifest is not None and manifest['version'] == dataset_version(csv_path)
+
+
+def load_aggregates(path=AGGREGATES_DIR, csv_path=CLEAN_DATASET):
+    """
+    Loads the aggregate tables, when they are present and current.
+    :param path: Directory of the aggregate tables.
+    :param csv_path: Path of the cleaned dataset.
+    :return: Aggregates, or None when the tables are missing or outdated.
+    """
+    try:
+        manifest = read_manifest(path)
+        if manifest is None:
+            return None
+        if manifest['version'] != dataset_version(csv_path):
+            logger.warning(f"Aggregate tables outdated (version {manifest['version']}), not used")
+            return None
+
+        tables = {}
+        for name, table in manifest['tables'].items():
+            dims, value = table['dimensions'], table['measure']
+            df = pd.concat([pd.read_csv(os.path.join(path, file)) for file in table['files']], ignore_index=True)
+            if len(table['files']) > 1:
+                # Merge the segments appended by ingest_sales.py:
+                df = rollup_cube(df, dims, value).reset_index()
+            tables[name] = (dims, value, df)
+        logger.info(f"Aggregate tables of version {manifest['version']} loaded: {', '.join(tables)}")
+
+        first_date = manifest['first_date'] and pd.Timestamp(manifest['first_date']).date()
+        return Aggregates(version=manifest['version'], tables=tables, values=manifest['values'],
+                          first_date=first_date)
+
+    except Exception as e:
+        # The dashboard can still serve every view from the dataset:
+        logger.warning(f"Aggregate tables not loaded ({str(e)})")
+        return None
+
+
+def find_table(aggregates, keys, value, preds=()):
+    """
+    Finds the smallest aggregate table able to answer a selection: it must hold the measure and
+    every dimension kept or filtered by the selection.
+    :param aggregates: Aggregates returned by load_aggregates.
+    :param keys: Dimensions to keep.
+    :param value: Measure to be summed.
+    :param preds: Predicates of the filters (see query.predicates).
+    :return: Dataframe of the table, or None when no table holds the selection.
+    """
+    needed = set(keys) | {col for col, _ in preds}
+    candidates = [df for dims, measure, df in aggregates.tables.values() if measure == value and needed <= set(dims)]
+    return min(candidates, key=len) if candidates else None
+
+
+def aggregate_totals(table, keys, value, preds=()):
+    """
+    Totals of a selection rolled up from an aggregate table.
+    :param table: Dataframe returned by find_table.
+    :param keys: Dimensions to keep.
+    :param value: Measure to be summed.
+    :param preds: Predicates of the filters (see query.predicates).
+    :return: Dataframe with the kept dimensions and the total of the measure, sorted by the dimensions.
+    """
+    positions = query_positions(table, preds)
+    if positions is not None:
+        table = table.iloc[positions]
+    return rollup_cube(table, list(keys), value).reset_index()
@@ -1,6 +1,12 @@
 import dash
 # import dash_auth
 
+from logging_config import setup_logging
+from metrics import init_metrics
+
+# Send the logs of every module through the background logging thread:
+setup_logging()
+
 # Define the global font for the app:
 FONT_AWESOME = ["https://use.fontawesome.com/releases/v5.10.2/css/all.css"]
 
@@ -9,4 +15,7 @@ app = dash.Dash(__name__, external_stylesheets=FONT_AWESOME)
 
 # Instantiate the server:
 app.scripts.config.server_locally = True
-server = app.server
\ No newline at end of file
+server = app.server
+
+# Expose the callbacks' latency metrics on /metrics:
+init_metrics(server)
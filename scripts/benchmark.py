@@ -0,0 +1,257 @@
+import sys
+import json
+import inspect
+import time
+import argparse
+import platform
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+from constants import MONTHS_MAP
+from data_preprocessing import RAW_DATASET, clean_sales_data, validate_sales_data
+from sales_cube import build_sales_cube, build_cube_index
+from range_totals import build_range_totals
+from data_access import PandasStore
+import snapshot
+import visualizations_functions as vf
+from logging_config import setup_logging
+
+# Default benchmark matrix:
+ROW_COUNTS = [10_000, 1_000_000, 10_000_000]
+N_TEAMS = 4
+N_CONSULTANTS = 16
+N_CHANNELS = 6
+
+# Relative slowdown (or memory growth) above which a result is reported as a regression:
+REGRESSION_THRESHOLD = 0.10
+
+
+# ========================= SYNTHETIC DATA =========================
+
+def generate_raw_sales(rows, n_teams=N_TEAMS, n_consultants=N_CONSULTANTS, n_channels=N_CHANNELS,
+                       seed=0, sample_path=RAW_DATASET):
+    """
+    Generates raw sales rows with the same layout and value formats of sales_raw.csv.
+    Amounts, calls, durations and training columns are resampled from the real file;
+    teams, consultants and channels have configurable cardinalities. Every consultant
+    belongs to a single team, as in the real data.
+    :param rows: Number of rows to generate.
+    :param n_teams: Number of distinct teams.
+    :param n_consultants: Number of distinct consultants.
+    :param n_channels: Number of distinct marketing channels.
+    :param seed: Seed of the random generator.
+    :param sample_path: Raw dataset used as the source of the value distributions.
+    :return: Raw sales dataframe.
+    """
+    rng = np.random.default_rng(seed)
+    sample = pd.read_csv(sample_path)
+
+    def resample(col):
+        return sample[col].to_numpy()[rng.integers(0, len(sample), rows)]
+
+    def labels(prefix, n, real_values=()):
+        # Keep the real names first, then complete with synthetic ones:
+        names = list(real_values)[:n]
+        return np.array(names + [f"{prefix} {i}" for i in range(len(names) + 1, n + 1)], dtype=object)
+
+    teams = labels("Equipe", n_teams)
+    consultants = labels("Consultor", n_consultants, sorted(sample['Consultor'].unique()))
+    channels = labels("Canal", n_channels, sorted(sample['Meio de Propaganda'].unique()))
+    months = np.array(list(MONTHS_MAP), dtype=object)
+
+    consultant = rng.integers(0, n_consultants, rows)
+
+    return pd.DataFrame({
+        'Status de Pagamento': resample('Status de Pagamento'),
+        'Dia': rng.integers(1, 29, rows),
+        'Mês': months[rng.integers(0, 12, rows)],
+        'Meio de Propaganda': channels[rng.integers(0, n_channels, rows)],
+        'Valor Pago': resample('Valor Pago'),
+        'Chamadas Realizadas': resample('Chamadas Realizadas'),
+        'Duração da chamada': resample('Duração da chamada'),
+        'Modelo de Treinamento': resample('Modelo de Treinamento'),
+        'Nivel de Treinamento': resample('Nivel de Treinamento'),
+        'Código de Área': resample('Código de Área'),
+        'Equipe': teams[consultant % n_teams],
+        'Consultor': consultants[consultant],
+    })
+
+
+# ========================= MEASUREMENTS =========================
+
+def measure(func, repeat=3):
+    """
+    Times a function (best of `repeat` runs) and measures its peak of traced memory
+    in a separate run, so the tracing overhead does not affect the timing.
+    :param func: Function without arguments to be measured.
+    :param repeat: Number of timed runs.
+    :return: Dict with the best time in seconds and the peak memory in bytes.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'seconds': min(timings), 'peak_bytes': peak}
+
+
+def chart_targets(df):
+    """
+    Lists the chart builders of visualizations_functions with the arguments used by the dashboard.
+    :param df: Cleaned sales rows (or cube) given to every builder.
+    :return: Dict of {name: function without arguments}.
+    """
+    return {
+        'pie_consultant_by_team': lambda: vf.pie_consultant_by_team(df, ['Consultor', 'Equipe'], 'Valor Pago'),
+        'bar_consultant_by_team': lambda: vf.bar_consultant_by_team(df, ['Consultor', 'Equipe'], 'Valor Pago'),
+        'scatter_calls_by_day': lambda: vf.scatter_calls_by_day(df, 'Dia', 'Chamadas Realizadas'),
+        'scatter_calls_by_month': lambda: vf.scatter_calls_by_month(df, 'Mês', 'Chamadas Realizadas'),
+        'kpi_best_consultant': lambda: vf.kpi_best_consultant(df, ['Consultor', 'Equipe'], 'Valor Pago'),
+        'kpi_best_team': lambda: vf.kpi_best_team(df, 'Equipe', 'Valor Pago'),
+        'scatter_sales_month_teams': lambda: vf.scatter_sales_month_teams(df, ['Mês', 'Equipe'], 'Valor Pago'),
+        'bar_sales_by_team': lambda: vf.bar_sales_by_team(df, 'Equipe', 'Valor Pago'),
+        'paym_by_channel': lambda: vf.paym_by_channel(df, 'Meio de Propaganda', 'Valor Pago'),
+        'paym_by_channel_over_months': lambda: vf.paym_by_channel_over_months(df, ['Meio de Propaganda', 'Mês'],
+                                                                              'Valor Pago'),
+        'total_sales': lambda: vf.total_sales(df, 'Valor Pago'),
+    }
+
+
+def callback_targets(index, cube, team):
+    """
+    Lists the bodies of the index.py callbacks (without their cache and instrumentation),
+    served from the given cube. Every call publishes a snapshot with a new dataset version,
+    so the shared selections are recomputed.
+    :param index: The imported index module.
+    :param cube: Cube built from the synthetic data.
+    :param team: Team used by the filtered calls.
+    :return: Dict of {name: function without arguments}.
+    """
+    store = PandasStore(None, cube, build_cube_index(cube), build_range_totals(cube))
+    versions = iter(range(sys.maxsize))
+
+    def body(callback, *args):
+        def run():
+            snapshot.publish(snapshot.Snapshot(version=f"benchmark-{next(versions)}", store=store))
+            return inspect.unwrap(callback)(*args)
+        return run
+
+    return {
+        'graph1_and_2': body(index.graph1_and_2, [5], [], [], None, None, True),
+        'graph3': body(index.graph3, [team], [5], [], [], None, None, True),
+        'graph4': body(index.graph4, [team], [], [], None, None, True),
+        'indicator1_and_2': body(index.indicator1_and_2, [5], [], [], None, None, True),
+        'graph5': body(index.graph5, None, True),
+        'graph6': body(index.graph6, [5], [], [], None, None, True),
+        'graph7': body(index.graph7, [5], [team], [], [], None, None, True),
+        'graph8': body(index.graph8, [team], [], [], None, None, True),
+        'indicator3': body(index.indicator3, [5], [team], [], [], None, None, True),
+    }
+
+
+def run_benchmarks(row_counts=ROW_COUNTS, n_teams=N_TEAMS, n_consultants=N_CONSULTANTS,
+                   n_channels=N_CHANNELS, repeat=3):
+    """
+    Runs every benchmark across the matrix of row counts.
+    :return: List of result records.
+    """
+    import index
+    index.wait_until_ready()
+
+    results = []
+    for rows in row_counts:
+        params = {'rows': rows, 'teams': n_teams, 'consultants': n_consultants, 'channels': n_channels}
+        print(f"Generating {rows} rows...", file=sys.stderr)
+        raw = generate_raw_sales(rows, n_teams, n_consultants, n_channels)
+
+        def record(kind, name, func):
+            result = {'kind': kind, 'target': name, **params, **measure(func, repeat)}
+            results.append(result)
+            print(f"{kind:>9} {name:<28} {rows:>10} rows  {result['seconds'] * 1000:10.2f} ms  "
+                  f"{result['peak_bytes'] / 2 ** 20:9.1f} MiB", file=sys.stderr)
+
+        record('pipeline', 'validate_sales_data', lambda: validate_sales_data(raw.copy()))
+        # The cleaning receives the valid rows with the values converted by the validation:
+        valid, _ = validate_sales_data(raw)
+        del raw
+        record('pipeline', 'clean_sales_data', lambda: clean_sales_data(valid.copy()))
+        df = clean_sales_data(valid)
+        del valid
+        record('pipeline', 'build_sales_cube', lambda: build_sales_cube(df))
+        cube = build_sales_cube(df)
+
+        for name, func in chart_targets(df).items():
+            record('chart', name, func)
+        for name, func in callback_targets(index, cube, df['Equipe'].iloc[0]).items():
+            record('callback', name, func)
+
+    return results
+
+
+# ========================= BASELINE COMPARISON =========================
+
+def compare_results(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Compares results against a stored baseline run.
+    :param results: Result records of the current run.
+    :param baseline: Result records of the baseline run.
+    :param threshold: Relative growth reported as a regression.
+    :return: List of comparison records, with the ratio current/baseline of time and memory.
+    """
+    def key(r):
+        return r['kind'], r['target'], r['rows'], r['teams'], r['consultants'], r['channels']
+
+    reference = {key(r): r for r in baseline}
+    comparison = []
+    for r in results:
+        base = reference.get(key(r))
+        if base is None:
+            continue
+        time_ratio = r['seconds'] / base['seconds'] if base['seconds'] else float('inf')
+        memory_ratio = r['peak_bytes'] / base['peak_bytes'] if base['peak_bytes'] else float('inf')
+        comparison.append({'kind': r['kind'], 'target': r['target'], 'rows': r['rows'],
+                           'time_ratio': time_ratio, 'memory_ratio': memory_ratio,
+                           'regression': time_ratio > 1 + threshold or memory_ratio > 1 + threshold})
+    return comparison
+
+
+if __name__ == '__main__':
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Benchmark the chart builders and callbacks on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=ROW_COUNTS, help="Row counts to benchmark.")
+    parser.add_argument('--teams', type=int, default=N_TEAMS, help="Number of teams.")
+    parser.add_argument('--consultants', type=int, default=N_CONSULTANTS, help="Number of consultants.")
+    parser.add_argument('--channels', type=int, default=N_CHANNELS, help="Number of marketing channels.")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per benchmark (best is kept).")
+    parser.add_argument('--output', default='benchmark_results.json', help="File where results are saved.")
+    parser.add_argument('--baseline', help="Results of a previous run to compare against.")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="Relative growth reported as a regression.")
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.rows, args.teams, args.consultants, args.channels, args.repeat)
+    report = {'python': platform.python_version(), 'pandas': pd.__version__, 'numpy': np.__version__,
+              'results': results}
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['comparison'] = compare_results(results, json.load(f)['results'], args.threshold)
+        for c in report['comparison']:
+            flag = 'REGRESSION' if c['regression'] else ''
+            print(f"{c['kind']:>9} {c['target']:<28} {c['rows']:>10} rows  time x{c['time_ratio']:.2f}  "
+                  f"memory x{c['memory_ratio']:.2f}  {flag}", file=sys.stderr)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+
+    # Non-zero exit code when something got worse, so the run can gate a change:
+    sys.exit(1 if any(c['regression'] for c in report.get('comparison', [])) else 0)
@@ -0,0 +1,6 @@
+# Codes given by the cleaning (data_preprocessing.py) to the raw values of the month and payment
+# status columns. The dashboard lists them in its filters, so they are kept apart from the cleaning
+# code, which the serving processes do not need to import.
+MONTHS_MAP = {'Jan': 1, 'Fev': 2, 'Mar': 3, 'Abr': 4, 'Mai': 5, 'Jun': 6,
+              'Jul': 7, 'Ago': 8, 'Set': 9, 'Out': 10, 'Nov': 11, 'Dez': 12}
+PAYMENT_STATUS_MAP = {'Pago': 1, 'Não pago': 0}
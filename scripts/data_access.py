@@ -0,0 +1,326 @@
+import os
+import sqlite3
+import logging
+import threading
+import numpy as np
+import pandas as pd
+
+from aggregates import AGGREGATES_DIR, aggregate_totals, find_table, load_aggregates
+from data_loader import CLEAN_DATASET, DATE_COLUMN, DURATION_COLUMN, duration_to_seconds, load_sales_data
+from query import query_positions
+from range_totals import RANGE_GROUPS, MONTH_COLUMN, build_range_totals, range_totals
+from sales_cube import load_sales_cube, build_cube_index, slice_cube, rollup_cube
+
+logger = logging.getLogger(__name__)
+
+# Storage read by the dashboard: 'pandas' keeps the dataset in memory (default), 'sqlite' queries
+# the database written by data_preprocessing.py on disk, so each process only holds the results:
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'pandas')
+
+# Database written by data_preprocessing.py and kept up to date by ingest_sales.py:
+SALES_DATABASE = "../datasets/sales_analysis.db"
+SALES_TABLE = 'sales'
+
+# Number of rows read at a time by the stores when streaming the rows of a selection:
+EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 100_000))
+
+# Indexes of the database, one per group of columns filtered together by the dashboard:
+SALES_INDEXES = {
+    'idx_sales_month_team': ['Mês', 'Equipe'],
+    'idx_sales_consultant': ['Consultor'],
+    'idx_sales_channel': ['Meio de Propaganda'],
+    'idx_sales_date': [DATE_COLUMN],
+}
+
+
+def _quote(name):
+    """
+    Quotes a column name for SQL (the names of the dataset have spaces and accents).
+    """
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _to_database(chunk):
+    # Durations as seconds, dates as "YYYY-MM-DD" text (compared as text by the range filter):
+    chunk = chunk.copy()
+    if not pd.api.types.is_integer_dtype(chunk[DURATION_COLUMN]):
+        chunk[DURATION_COLUMN] = duration_to_seconds(chunk[DURATION_COLUMN])
+    chunk[DATE_COLUMN] = pd.to_datetime(chunk[DATE_COLUMN]).dt.strftime('%Y-%m-%d')
+    return chunk
+
+
+# ========================= SQLITE DATABASE =========================
+
+def write_sales_database(csv_path=CLEAN_DATASET, db_path=SALES_DATABASE, chunksize=500_000):
+    """
+    Loads the cleaned CSV into a SQLite database, streamed chunk by chunk, and creates the
+    indexes of the dashboard's filters once the rows are in (faster than maintaining them
+    row by row). The database is written to a temporary file and moved into place at the end.
+    :param csv_path: Path of the cleaned dataset.
+    :param db_path: Path of the database.
+    :param chunksize: Number of rows loaded at a time.
+    :return: Number of rows written.
+    """
+    try:
+        tmp_path = db_path + ".tmp"
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        rows = 0
+        with sqlite3.connect(tmp_path) as conn:
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                _to_database(chunk).to_sql(SALES_TABLE, conn, if_exists='append', index=False)
+                rows += len(chunk)
+
+            for name, cols in SALES_INDEXES.items():
+                conn.execute(f"CREATE INDEX {name} ON {SALES_TABLE} ({', '.join(map(_quote, cols))})")
+            # Collect the statistics used by SQLite to choose between the indexes:
+            conn.execute("ANALYZE")
+        conn.close()
+
+        os.replace(tmp_path, db_path)
+
+        return rows
+
+    except Exception as e:
+        logger.error(f"Error while writing the sales database: {str(e)}")
+        raise
+
+
+def append_sales_database(df, db_path=SALES_DATABASE):
+    """
+    Appends cleaned rows to the database in a single transaction, so readers see either none
+    or all of them.
+    :param df: Cleaned rows, with the same columns of the dataset.
+    :param db_path: Path of the database.
+    """
+    try:
+        with sqlite3.connect(db_path) as conn:
+            _to_database(df).to_sql(SALES_TABLE, conn, if_exists='append', index=False)
+        conn.close()
+
+    except Exception as e:
+        logger.error(f"Error while appending to the sales database: {str(e)}")
+        raise
+
+
+# ========================= DATA-ACCESS INTERFACE =========================
+
+# Every store answers the same questions of the callbacks:
+#     totals(keys, value, preds, start, end): dataframe of the total of `value` by `keys`, over the
+#         rows matching the predicates (see query.predicates) within the date range, sorted by `keys`;
+#     rows(preds, start, end, chunksize): dataframes of at most `chunksize` rows of the selection, in
+#         the order of the dataset (durations in seconds), so a selection is never held in memory at once;
+#     columns: columns of the rows;
+#     values(column): distinct values of a column, in order of appearance;
+#     first_date(): first date of the dataset.
+
+class PandasStore:
+    """
+    Serves the dataset from memory: totals by the dimensions of the prefix sums are read from
+    them, any other totals are rolled up from a slice of the cube.
+    """
+
+    def __init__(self, df, cube, index, prefix_sums):
+        self.df = df
+        self.cube = cube
+        self.index = index
+        self.prefix_sums = prefix_sums
+
+    @classmethod
+    def load(cls, csv_path=CLEAN_DATASET):
+        """
+        Loads the cleaned dataset and builds the cube, its filter index and the prefix sums.
+        :param csv_path: Path of the cleaned dataset.
+        :return: PandasStore.
+        """
+        df = load_sales_data(csv_path)
+        # Load the pre-aggregated cube (or build it once), so the callbacks only slice and roll up the cube:
+        cube = load_sales_cube(df, csv_path=csv_path)
+        # Index the cube's rows by the filtered dimensions, so each filter is a single gather:
+        index = build_cube_index(cube)
+        # Running totals by day of the groups of the charts, so a date range costs two binary searches per group:
+        prefix_sums = build_range_totals(cube)
+
+        return cls(df, cube, index, prefix_sums)
+
+    def totals(self, keys, value, preds=(), start=None, end=None):
+        columns = set(RANGE_GROUPS) | {MONTH_COLUMN}
+        if set(keys) <= set(RANGE_GROUPS) and all(col in columns for col, _ in preds):
+            return range_totals(self.prefix_sums, keys, value, preds, start=start, end=end)
+
+        cube_slice = slice_cube(self.cube, dict(preds), index=self.index, start=start, end=end)
+        return rollup_cube(cube_slice, list(keys), value).reset_index()
+
+    def rows(self, preds=(), start=None, end=None, chunksize=EXPORT_CHUNK_ROWS):
+        for first in range(0, len(self.df), chunksize):
+            block = self.df.iloc[first:first + chunksize]
+            positions = query_positions(block, preds)
+            if positions is not None:
+                block = block.iloc[positions]
+            if start is not None:
+                block = block[block[DATE_COLUMN] >= pd.Timestamp(start)]
+            if end is not None:
+                block = block[block[DATE_COLUMN] <= pd.Timestamp(end)]
+            yield block
+
+    @property
+    def columns(self):
+        return list(self.df.columns)
+
+    def values(self, column):
+        return list(self.df[column].unique())
+
+    def first_date(self):
+        # The cube is sorted by date:
+        return self.cube[DATE_COLUMN].iloc[0].date()
+
+
+def _connect_read_only(db_path):
+    # Read-only mode never creates the file: a missing database fails here instead of leaving an
+    # empty file behind, which would look like a valid database to the next existence checks.
+    return sqlite3.connect(f"file:{os.path.abspath(db_path)}?mode=ro", uri=True)
+
+
+class SQLiteStore:
+    """
+    Serves the dataset from the SQLite database: every total is a GROUP BY query using the indexes
+    of the filters, so memory does not grow with the size of the dataset.
+    """
+
+    def __init__(self, db_path=SALES_DATABASE):
+        self.db_path = db_path
+        self._local = threading.local()
+        conn = _connect_read_only(db_path)
+        try:
+            self.columns = [row[1] for row in conn.execute(f"PRAGMA table_info({SALES_TABLE})")]
+        finally:
+            conn.close()
+        if not self.columns:
+            raise ValueError(f"No table '{SALES_TABLE}' in {db_path}, run data_preprocessing.py")
+
+    def _connection(self):
+        # One read-only connection per thread, opened again within forked processes (SQLite
+        # connections must not be used across a fork):
+        if getattr(self._local, 'pid', None) != os.getpid():
+            self._local.conn, self._local.pid = _connect_read_only(self.db_path), os.getpid()
+        return self._local.conn
+
+    def _column(self, name):
+        # Names are part of the SQL text, so only the columns of the table are accepted:
+        if name not in self.columns:
+            raise ValueError(f"Unknown column '{name}'")
+        return _quote(name)
+
+    def _where(self, preds, start, end):
+        # WHERE clause of a selection, with its values passed as parameters:
+        conditions, params = [], []
+        for col, values in preds:
+            conditions.append(f"{self._column(col)} IN ({', '.join('?' * len(values))})")
+            params += [v.item() if isinstance(v, np.generic) else v for v in values]
+        if start is not None:
+            conditions.append(f"{self._column(DATE_COLUMN)} >= ?")
+            params.append(pd.Timestamp(start).strftime('%Y-%m-%d'))
+        if end is not None:
+            conditions.append(f"{self._column(DATE_COLUMN)} <= ?")
+            params.append(pd.Timestamp(end).strftime('%Y-%m-%d'))
+
+        return (f" WHERE {' AND '.join(conditions)}" if conditions else ''), params
+
+    def totals(self, keys, value, preds=(), start=None, end=None):
+        group = ', '.join(self._column(key) for key in keys)
+        where, params = self._where(preds, start, end)
+
+        sql = (f"SELECT {group}, SUM({self._column(value)}) AS {_quote(value)} FROM {SALES_TABLE}{where}"
+               f" GROUP BY {group} ORDER BY {group}")
+
+        return pd.read_sql_query(sql, self._connection(), params=params)
+
+    def rows(self, preds=(), start=None, end=None, chunksize=EXPORT_CHUNK_ROWS):
+        where, params = self._where(preds, start, end)
+        # The cursor fetches `chunksize` rows at a time:
+        yield from pd.read_sql_query(f"SELECT * FROM {SALES_TABLE}{where} ORDER BY rowid", self._connection(),
+                                     params=params, chunksize=chunksize)
+
+    def values(self, column):
+        col = self._column(column)
+        rows = self._connection().execute(f"SELECT {col} FROM {SALES_TABLE} GROUP BY {col} ORDER BY MIN(rowid)")
+        return [row[0] for row in rows]
+
+    def first_date(self):
+        row = self._connection().execute(f"SELECT MIN({self._column(DATE_COLUMN)}) FROM {SALES_TABLE}").fetchone()
+        return pd.Timestamp(row[0]).date()
+
+
+class AggregateStore:
+    """
+    Serves the standard views of the dashboard (every date, filtered by month and team only) from
+    the aggregate tables written by data_preprocessing.py, and any other selection from the store of
+    the backend. That store is only opened by the first selection needing it, so a dashboard showing
+    the standard views never loads the rows of the dataset.
+    """
+
+    def __init__(self, aggregates, open_backend):
+        self.aggregates = aggregates
+        self._open_backend = open_backend
+        self._backend = None
+        self._lock = threading.Lock()
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self._open_backend()
+        return self._backend
+
+    def totals(self, keys, value, preds=(), start=None, end=None):
+        table = find_table(self.aggregates, keys, value, preds) if start is None and end is None else None
+        if table is None:
+            return self.backend.totals(keys, value, preds, start=start, end=end)
+        return aggregate_totals(table, keys, value, preds)
+
+    def rows(self, preds=(), start=None, end=None, chunksize=EXPORT_CHUNK_ROWS):
+        return self.backend.rows(preds, start=start, end=end, chunksize=chunksize)
+
+    @property
+    def columns(self):
+        return self.backend.columns
+
+    def values(self, column):
+        if column in self.aggregates.values:
+            return self.aggregates.values[column]
+        return self.backend.values(column)
+
+    def first_date(self):
+        return self.aggregates.first_date
+
+
+def dataset_path(backend=STORAGE_BACKEND):
+    """
+    Returns the file the stores of a backend are loaded from (its changes trigger a reload).
+    """
+    return SALES_DATABASE if backend == 'sqlite' else CLEAN_DATASET
+
+
+def open_store(path=None, backend=STORAGE_BACKEND, aggregates_path=AGGREGATES_DIR):
+    """
+    Opens the store of the configured backend, behind the aggregate tables when they are current.
+    :param path: Path of the cleaned dataset (pandas) or of the database (sqlite), None for the default.
+    :param backend: 'pandas' or 'sqlite'.
+    :param aggregates_path: Directory of the aggregate tables (None to ignore them).
+    :return: AggregateStore, PandasStore or SQLiteStore.
+    """
+    if backend == 'sqlite':
+        open_backend = lambda: SQLiteStore(path or SALES_DATABASE)
+    elif backend == 'pandas':
+        open_backend = lambda: PandasStore.load(path or CLEAN_DATASET)
+    else:
+        raise ValueError(f"Unknown storage backend '{backend}'")
+
+    # The tables are current when built from the cleaned CSV as it is now:
+    csv_path = path if backend == 'pandas' and path else CLEAN_DATASET
+    aggregates = load_aggregates(aggregates_path, csv_path) if aggregates_path else None
+    if aggregates is None:
+        return open_backend()
+    return AggregateStore(aggregates, open_backend)
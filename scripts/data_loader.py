@@ -0,0 +1,358 @@
+import os
+import json
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+
+from logging_config import setup_logging
+
+logger = logging.getLogger(__name__)
+
+# Default location of the cleaned dataset, as CSV and as a directory of column files:
+CLEAN_DATASET = "../datasets/sales_analysis.csv"
+COLUMNAR_DATASET = "../datasets/sales_analysis_columns"
+
+# File describing the columns stored within the columnar dataset:
+SCHEMA_FILE = "schema.json"
+
+
+# ========================= TYPED REPRESENTATION =========================
+
+# Low-cardinality dimensions, kept in memory as dictionary-encoded (categorical) columns:
+CATEGORY_COLUMNS = ['Meio de Propaganda', 'Modelo de Treinamento', 'Nivel de Treinamento',
+                    'Código de Área', 'Equipe', 'Consultor']
+
+# Call duration: "h:mm:ss" text in the CSV files, integer seconds in memory:
+DURATION_COLUMN = 'Duração da chamada'
+
+# Date of each sale: "YYYY-MM-DD" text in the CSV files, datetime64 in memory:
+DATE_COLUMN = 'Data'
+
+# Columns of the cleaned dataset, in order:
+CLEAN_COLUMNS = ['Status de Pagamento', 'Dia', 'Mês', 'Meio de Propaganda', 'Valor Pago', 'Chamadas Realizadas',
+                 DURATION_COLUMN, 'Modelo de Treinamento', 'Nivel de Treinamento', 'Código de Área', 'Equipe',
+                 'Consultor', DATE_COLUMN]
+
+# Types given to pd.read_csv for the cleaned dataset:
+CSV_DTYPES = {col: 'category' for col in CATEGORY_COLUMNS}
+
+
+def duration_to_seconds(duration):
+    """
+    Converts "h:mm:ss" durations into integer seconds.
+    :param duration: Series of strings formatted as "h:mm:ss".
+    :return: Series of seconds.
+    """
+    if duration.empty:
+        return pd.Series(dtype=np.int64, index=duration.index)
+    parts = duration.astype(str).str.split(':', n=2, expand=True).astype(int)
+    return parts[0] * 3600 + parts[1] * 60 + parts[2]
+
+
+def seconds_to_duration(seconds):
+    """
+    Converts integer seconds back into "h:mm:ss" durations, as written in the CSV files. Each
+    distinct duration is formatted once and mapped back to the rows.
+    :param seconds: Series of seconds.
+    :return: Series of strings formatted as "h:mm:ss".
+    """
+    codes, uniques = pd.factorize(seconds)
+    uniques = pd.Series(uniques, dtype=np.int64)
+    formatted = ((uniques // 3600).astype(str) + ':' + (uniques // 60 % 60).astype(str).str.zfill(2) + ':' +
+                 (uniques % 60).astype(str).str.zfill(2)).to_numpy(dtype=object)
+    return pd.Series(formatted[codes], index=seconds.index)
+
+
+def narrowest_int_dtype(min_value, max_value):
+    """
+    Returns the smallest signed integer type holding every value between the given bounds.
+    """
+    for dtype in (np.int8, np.int16, np.int32):
+        if np.iinfo(dtype).min <= min_value and max_value <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+def _codes_dtype(n_categories):
+    """
+    Returns the type pandas uses for the codes of a categorical with `n_categories`, so that the
+    memory-mapped codes are wrapped without being copied.
+    """
+    return pd.Categorical.from_codes([], categories=range(n_categories)).codes.dtype
+
+
+def to_typed(df):
+    """
+    Converts the cleaned sales columns to their compact in-memory types: dictionary-encoded
+    dimensions, the narrowest safe integer widths, durations as integer seconds and dates.
+    :param df: Cleaned sales dataframe (read with CSV_DTYPES or not).
+    :return: Typed dataframe.
+    """
+    try:
+        if DURATION_COLUMN in df and not pd.api.types.is_integer_dtype(df[DURATION_COLUMN]):
+            df[DURATION_COLUMN] = duration_to_seconds(df[DURATION_COLUMN])
+        if DATE_COLUMN in df and not pd.api.types.is_datetime64_dtype(df[DATE_COLUMN]):
+            df[DATE_COLUMN] = pd.to_datetime(df[DATE_COLUMN], format='%Y-%m-%d')
+
+        for col in df.columns:
+            if col in CATEGORY_COLUMNS:
+                if not isinstance(df[col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype('category')
+            elif pd.api.types.is_integer_dtype(df[col]) and len(df):
+                df[col] = df[col].astype(narrowest_int_dtype(df[col].min(), df[col].max()))
+
+        return df
+
+    except Exception as e:
+        logger.error(f"Error while converting the sales dataset types: {str(e)}")
+        raise
+
+
+def memory_mib(df):
+    """
+    Returns the memory used by a dataframe (including the Python strings it holds), in MiB.
+    """
+    return df.memory_usage(deep=True).sum() / 2 ** 20
+
+
+# ========================= COLUMNAR DATASET =========================
+
+def write_columnar(csv_path=CLEAN_DATASET, columnar_path=COLUMNAR_DATASET, chunksize=500_000):
+    """
+    Converts the cleaned CSV into a directory with one typed .npy file per column.
+    Integer columns (durations included, as seconds) use the narrowest type holding their
+    values, dates are stored as datetime64 seconds and text columns are stored as dictionary
+    codes with their sorted categories saved in the schema file.
+    The CSV is streamed twice (collect the types, then fill the arrays), so memory stays bounded.
+    :param csv_path: Path of the cleaned dataset.
+    :param columnar_path: Directory where the column files are written.
+    :param chunksize: Number of rows converted at a time.
+    :return: Number of rows written.
+    """
+    try:
+        # First pass: count the rows and collect the range/categories of every column.
+        rows, stats = 0, {}
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=CSV_DTYPES):
+            chunk = to_typed(chunk)
+            rows += len(chunk)
+            for col in chunk.columns:
+                if isinstance(chunk[col].dtype, pd.CategoricalDtype):
+                    stats.setdefault(col, set()).update(chunk[col].cat.categories)
+                else:
+                    low, high = stats.get(col, (chunk[col].min(), chunk[col].max()))
+                    stats[col] = (min(low, chunk[col].min()), max(high, chunk[col].max()))
+
+        tmp_path = columnar_path + ".tmp"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        columns, arrays = [], {}
+        for i, (col, stat) in enumerate(stats.items()):
+            column = {'name': col, 'file': f"{i:02d}.npy"}
+            if isinstance(stat, set):
+                column.update(kind='category', categories=sorted(stat))
+                dtype = _codes_dtype(len(stat))
+            elif col == DATE_COLUMN:
+                column['kind'] = 'date'
+                dtype = np.dtype('datetime64[s]')
+            elif not rows:
+                # Nothing to size the integer columns of a dataset without any row: appending rows
+                # to the narrowest type fails, so the copy is rebuilt instead (see append_columnar).
+                column['kind'] = 'numeric'
+                dtype = narrowest_int_dtype(0, 0)
+            else:
+                column['kind'] = 'numeric'
+                dtype = narrowest_int_dtype(*stat) if isinstance(stat[0], (int, np.integer)) else np.float64
+            columns.append(column)
+            arrays[col] = np.lib.format.open_memmap(os.path.join(tmp_path, column['file']), mode='w+',
+                                                    dtype=dtype, shape=(rows,))
+
+        # Second pass: fill the column files chunk by chunk.
+        start = 0
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype=CSV_DTYPES):
+            chunk = to_typed(chunk)
+            stop = start + len(chunk)
+            for column in columns:
+                values = chunk[column['name']]
+                if column['kind'] == 'category':
+                    # Missing values get code -1:
+                    values = pd.Categorical(values, categories=column['categories']).codes
+                arrays[column['name']][start:stop] = values
+            start = stop
+
+        for array in arrays.values():
+            array.flush()
+        del arrays
+
+        with open(os.path.join(tmp_path, SCHEMA_FILE), 'w', encoding='utf-8') as f:
+            json.dump({'rows': rows, 'columns': columns}, f, ensure_ascii=False)
+
+        # Replace the previous version of the dataset:
+        shutil.rmtree(columnar_path, ignore_errors=True)
+        os.replace(tmp_path, columnar_path)
+
+        return rows
+
+    except Exception as e:
+        logger.error(f"Error while writing the columnar dataset: {str(e)}")
+        raise
+
+
+def _append_npy(path, values):
+    """
+    Appends values to a one-dimensional .npy file in place: the data is written at the end of
+    the file and the header is rewritten with the new length. numpy pads the header so that
+    it keeps the same size when the length grows, so no existing data is moved.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version != (1, 0):
+            raise ValueError(f"Unsupported .npy version {version} for {path}")
+        shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(f)
+        data_start = f.tell()
+
+        f.seek(0, os.SEEK_END)
+        f.write(np.ascontiguousarray(values, dtype=dtype).tobytes())
+
+        f.seek(0)
+        np.lib.format.write_array_header_1_0(f, {'descr': np.lib.format.dtype_to_descr(dtype),
+                                                 'fortran_order': fortran_order,
+                                                 'shape': (shape[0] + len(values),)})
+        if f.tell() != data_start:
+            raise ValueError(f"Header of {path} cannot grow in place, rebuild the columnar dataset")
+
+
+def append_columnar(df, columnar_path=COLUMNAR_DATASET):
+    """
+    Appends cleaned rows to the columnar dataset, writing only the new rows. Values not seen
+    before are added at the end of the categories of their column, so existing codes are kept.
+    The schema is written last: until then, readers keep seeing the previous number of rows.
+    :param df: Cleaned rows, with the same columns of the dataset.
+    :param columnar_path: Directory written by write_columnar.
+    :return: Total number of rows of the dataset.
+    """
+    try:
+        schema_path = os.path.join(columnar_path, SCHEMA_FILE)
+        with open(schema_path, encoding='utf-8') as f:
+            schema = json.load(f)
+
+        df = to_typed(df.copy())
+
+        # Check every column before writing, so a failure leaves the dataset untouched:
+        new_columns = []
+        for column in schema['columns']:
+            path = os.path.join(columnar_path, column['file'])
+            dtype = np.load(path, mmap_mode='r').dtype
+            values = df[column['name']]
+            if column['kind'] == 'category':
+                new_values = sorted(set(values.dropna()) - set(column['categories']))
+                column['categories'] = column['categories'] + new_values
+                values = pd.Categorical(values, categories=column['categories']).codes
+                if _codes_dtype(len(column['categories'])) != dtype:
+                    raise ValueError(f"Too many new values in '{column['name']}', rebuild the columnar dataset")
+            elif len(values) and np.issubdtype(dtype, np.integer) and \
+                    (values.min() < np.iinfo(dtype).min or values.max() > np.iinfo(dtype).max):
+                raise ValueError(f"Values of '{column['name']}' out of the stored range, rebuild the columnar dataset")
+            new_columns.append((path, np.asarray(values)))
+
+        for path, values in new_columns:
+            _append_npy(path, values)
+
+        schema['rows'] += len(df)
+        tmp_path = schema_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(schema, f, ensure_ascii=False)
+        os.replace(tmp_path, schema_path)
+
+        return schema['rows']
+
+    except Exception as e:
+        logger.error(f"Error while appending to the columnar dataset: {str(e)}")
+        raise
+
+
+def read_columnar(columnar_path=COLUMNAR_DATASET):
+    """
+    Opens the columnar dataset memory-mapped. The column files are not read into
+    memory: pages are loaded on demand and shared between processes by the OS page cache.
+    :param columnar_path: Directory written by write_columnar.
+    :return: Dataframe backed by the memory-mapped column files.
+    """
+    try:
+        with open(os.path.join(columnar_path, SCHEMA_FILE), encoding='utf-8') as f:
+            schema = json.load(f)
+
+        data = {}
+        for column in schema['columns']:
+            # Rows appended after the last schema update (interrupted ingestion) are ignored:
+            values = np.load(os.path.join(columnar_path, column['file']), mmap_mode='r')[:schema['rows']]
+            if column['kind'] == 'category':
+                values = pd.Categorical.from_codes(values, categories=column['categories'])
+                if column['categories'] != sorted(column['categories']):
+                    # New values added by append_columnar come last: sort them again to keep the
+                    # order of the charts (this copies the codes until the next full rebuild).
+                    values = values.reorder_categories(sorted(column['categories']))
+            data[column['name']] = values
+
+        return pd.DataFrame(data, copy=False)
+
+    except Exception as e:
+        logger.error(f"Error while reading the columnar dataset: {str(e)}")
+        raise
+
+
+def is_up_to_date(path, csv_path=CLEAN_DATASET):
+    """
+    Checks whether a file derived from the cleaned dataset was written after its last change.
+    :param path: Path of the derived file (columnar schema, cube...).
+    :param csv_path: Path of the cleaned dataset.
+    :return: True when the derived file exists and is at least as recent as the dataset.
+    """
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(csv_path)
+
+
+def dataset_version(csv_path=CLEAN_DATASET):
+    """
+    Identifies the version of the cleaned dataset from the size and modification time
+    of its file, so every worker reading the same file agrees on the version.
+    :param csv_path: Path of the cleaned dataset.
+    :return: Version as a string.
+    """
+    stat = os.stat(csv_path)
+    return f"{stat.st_size}-{stat.st_mtime_ns}"
+
+
+def load_sales_data(csv_path=CLEAN_DATASET, columnar_path=COLUMNAR_DATASET):
+    """
+    Loads the cleaned sales dataset, preferring the memory-mapped columnar copy
+    whenever it is at least as recent as the CSV.
+    :param csv_path: Path of the cleaned dataset.
+    :param columnar_path: Directory of the columnar dataset.
+    :return: Cleaned sales dataframe.
+    """
+    try:
+        if is_up_to_date(os.path.join(columnar_path, SCHEMA_FILE), csv_path):
+            return read_columnar(columnar_path)
+
+        logger.warning(f"Columnar dataset missing or outdated, parsing {csv_path}")
+        df = to_typed(pd.read_csv(csv_path, dtype=CSV_DTYPES))
+        logger.info(f"Sales dataset loaded: {len(df)} rows, {memory_mib(df):.1f} MiB")
+        return df
+
+    except Exception as e:
+        logger.error(f"Error while loading the sales dataset: {str(e)}")
+        raise
+
+
+if __name__ == '__main__':
+    setup_logging()
+    # Report the memory saved by the typed representation of the cleaned dataset:
+    plain = pd.read_csv(CLEAN_DATASET)
+    typed = to_typed(pd.read_csv(CLEAN_DATASET, dtype=CSV_DTYPES))
+    for col in plain.columns:
+        print(f"{col:<24} {str(plain[col].dtype):>8} -> {str(typed[col].dtype):<10} "
+              f"{plain[col].memory_usage(deep=True, index=False) / 2 ** 10:10.1f} KiB -> "
+              f"{typed[col].memory_usage(deep=True, index=False) / 2 ** 10:8.1f} KiB")
+    print(f"Total: {memory_mib(plain):.2f} MiB -> {memory_mib(typed):.2f} MiB "
+          f"({memory_mib(plain) / memory_mib(typed):.1f}x smaller)")
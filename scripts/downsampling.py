@@ -0,0 +1,130 @@
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Points drawn per pixel of chart width (one point per pixel is all a line can show):
+POINTS_PER_PIXEL = 1
+
+# Width of the dashboard assumed to split the point budget between the charts (full HD screen):
+DASHBOARD_WIDTH = 1920
+
+LTTB = 'lttb'
+MIN_MAX = 'min_max'
+
+
+def points_for_width(columns, dashboard_width=DASHBOARD_WIDTH, points_per_pixel=POINTS_PER_PIXEL):
+    """
+    Point budget of a chart from its width in the grid of the layout.
+    :param columns: Number of bootstrap columns (out of 12) taken by the chart.
+    :param dashboard_width: Width of the dashboard, in pixels.
+    :param points_per_pixel: Points drawn per pixel.
+    :return: Maximum number of points of each series of the chart.
+    """
+    return int(dashboard_width * columns / 12 * points_per_pixel)
+
+
+def _numeric(values):
+    # Dates become nanoseconds and labels their positions, so the areas of the triangles can be computed:
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.datetime64):
+        return values.astype('datetime64[ns]').astype(np.int64).astype(float)
+    if not np.issubdtype(values.dtype, np.number):
+        return np.arange(len(values), dtype=float)
+    return values.astype(float)
+
+
+def lttb_positions(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets: keeps the first and last points and, in each bucket of
+    the points in between, the one forming the largest triangle with the point kept in the
+    previous bucket and the average of the next bucket. The shape of the line is preserved
+    with far fewer points.
+    :param x: Sorted x values (numbers or dates).
+    :param y: y values.
+    :param n_out: Number of points to keep (at least 3).
+    :return: Positions of the points kept, in ascending order.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    x, y = _numeric(x), _numeric(y)
+    # Bucket boundaries of the n - 2 points between the first and the last:
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+
+    positions = np.empty(n_out, dtype=np.int64)
+    positions[0], positions[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average point of the next bucket (the last point for the last bucket):
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:next_end].mean(), y[next_start:next_end].mean()
+
+        areas = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) -
+                       (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        positions[i + 1] = previous
+
+    return positions
+
+
+def min_max_positions(y, n_out):
+    """
+    Min/max bucketing: keeps the lowest and highest point of each bucket (plus the first and
+    last points), so peaks and valleys are never dropped. Suited to area charts.
+    :param y: y values, sorted by x.
+    :param n_out: Number of points to keep.
+    :return: Positions of the points kept, in ascending order.
+    """
+    n = len(y)
+    if n_out >= n or n_out < 4:
+        return np.arange(n)
+
+    y = _numeric(y)
+    edges = np.linspace(0, n, (n_out - 2) // 2 + 1).astype(int)
+    lowest = [start + np.argmin(y[start:end]) for start, end in zip(edges[:-1], edges[1:])]
+    highest = [start + np.argmax(y[start:end]) for start, end in zip(edges[:-1], edges[1:])]
+
+    return np.unique(np.concatenate([[0, n - 1], lowest, highest]).astype(np.int64))
+
+
+def downsample(df, x, y, max_points, method=LTTB, group=None):
+    """
+    Reduces the points of each series of a chart's dataframe to a budget. Rows are kept in
+    their original order and series already within the budget are left untouched.
+    :param df: Dataframe of the chart, sorted by x within each series.
+    :param x: Column of the x axis.
+    :param y: Column of the y axis.
+    :param max_points: Maximum number of points of each series (None keeps every point).
+    :param method: LTTB or MIN_MAX.
+    :param group: Column identifying the series (e.g. the color of px.line), None for a single series.
+    :return: Downsampled dataframe.
+    """
+    try:
+        if max_points is None or len(df) <= max_points:
+            return df
+
+        if group is None:
+            series = [np.arange(len(df))]
+        else:
+            series = list(df.groupby(group, observed=True, sort=False).indices.values())
+
+        kept = []
+        for rows in series:
+            if method == MIN_MAX:
+                selected = min_max_positions(df[y].to_numpy()[rows], max_points)
+            else:
+                selected = lttb_positions(df[x].to_numpy()[rows], df[y].to_numpy()[rows], max_points)
+            kept.append(rows[selected])
+
+        positions = np.sort(np.concatenate(kept))
+        if len(positions) < len(df):
+            logger.debug(f"Downsampled {y} by {x} from {len(df)} to {len(positions)} points")
+
+        return df.iloc[positions]
+
+    except Exception as e:
+        logger.error(f"Error while downsampling {y} by {x}: {str(e)}")
+        raise
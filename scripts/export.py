@@ -0,0 +1,103 @@
+import os
+import zlib
+import logging
+import pandas as pd
+
+from flask import Response, abort, request, stream_with_context
+
+from data_loader import DURATION_COLUMN, seconds_to_duration
+from query import predicates
+from snapshot import current_snapshot
+
+logger = logging.getLogger(__name__)
+
+# Compression level of the exported files (1 is the fastest, 9 the smallest):
+EXPORT_GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', 6))
+
+# Query parameters of /export, with the column they filter and the type of their values. They are
+# the filters of the dashboard, and can be repeated to select several values (?month=1&month=2):
+EXPORT_FILTERS = {
+    'month': ('Mês', int),
+    'team': ('Equipe', str),
+    'channel': ('Meio de Propaganda', str),
+    'status': ('Status de Pagamento', int),
+}
+
+
+def export_filters(args):
+    """
+    Reads the filters of an export from the query parameters of the request.
+    :param args: Query parameters (request.args).
+    :return: (filters as {column: selected values}, start date, end date), None for the dates not given.
+    """
+    try:
+        filters = {col: [cast(value) for value in args.getlist(name)] for name, (col, cast) in EXPORT_FILTERS.items()}
+        start, end = (args.get(name) or None for name in ('start', 'end'))
+        # Check the dates before the response starts, the stores would only fail half-way through it:
+        for date in filter(None, (start, end)):
+            pd.Timestamp(date)
+    except ValueError as e:
+        abort(400, f"Invalid filter value ({str(e)})")
+
+    return filters, start, end
+
+
+def csv_chunks(frames, columns):
+    """
+    Encodes dataframes as consecutive pieces of a single CSV file (the header comes with the first),
+    with the values written as in sales_analysis.csv: durations as "h:mm:ss" and dates as "YYYY-MM-DD".
+    :param frames: Iterable of dataframes with the same columns (durations in seconds, see data_access).
+    :param columns: Columns of the file, for the header of an empty export.
+    :return: Generator of encoded CSV pieces.
+    """
+    header = True
+    for frame in frames:
+        if not len(frame) and not header:
+            continue
+        if DURATION_COLUMN in frame:
+            frame = frame.assign(**{DURATION_COLUMN: seconds_to_duration(frame[DURATION_COLUMN])})
+        yield frame.to_csv(index=False, header=header, date_format='%Y-%m-%d').encode('utf-8')
+        header = False
+
+    if header:
+        yield (','.join(columns) + '\n').encode('utf-8')
+
+
+def gzip_chunks(chunks, level=EXPORT_GZIP_LEVEL):
+    """
+    Compresses a stream of bytes into a gzip stream, piece by piece.
+    :param chunks: Iterable of bytes.
+    :param level: Compression level.
+    :return: Generator of compressed bytes.
+    """
+    # wbits=31 writes the gzip header and trailer around the deflate stream:
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def init_export(server):
+    """
+    Installs the /export route on the Flask server: it streams the rows of the dataset matching the
+    filters of the dashboard as a CSV file. Rows are read, encoded and compressed a chunk at a time
+    (see data_access.EXPORT_CHUNK_ROWS), so the memory used does not depend on the size of the selection.
+    :param server: Flask instance of the Dash app.
+    """
+    @server.route('/export')
+    def export():
+        filters, start, end = export_filters(request.args)
+        # Stream the whole file from the same version of the dataset, even if a reload happens meanwhile:
+        store = current_snapshot().store
+
+        chunks = csv_chunks(store.rows(predicates(filters), start=start, end=end), store.columns)
+        # The encoding depends on the request, so caches must keep one response per Accept-Encoding:
+        headers = {'Content-Disposition': 'attachment; filename="sales_export.csv"', 'Vary': 'Accept-Encoding'}
+        if 'gzip' in request.accept_encodings:
+            chunks = gzip_chunks(chunks)
+            headers['Content-Encoding'] = 'gzip'
+
+        logger.info(f"Exporting the rows of {filters}, from {start} to {end}")
+        return Response(stream_with_context(chunks), mimetype='text/csv', headers=headers)
@@ -0,0 +1,220 @@
+import os
+import pickle
+import shutil
+import hashlib
+import logging
+import functools
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of callback results kept in memory by each process:
+FIGURE_CACHE_SIZE = int(os.environ.get('FIGURE_CACHE_SIZE', 512))
+
+# Optional directory shared by all server workers (disk tier disabled when not set). It must be
+# private to the user running the server, as its entries are unpickled:
+FIGURE_CACHE_DIR = os.environ.get('FIGURE_CACHE_DIR')
+
+# Maximum size of the files of the disk tier (the least recently used ones are removed first):
+FIGURE_CACHE_DISK_BYTES = int(os.environ.get('FIGURE_CACHE_DISK_BYTES', 256 * 2 ** 20))
+
+_MISSING = object()
+
+# Every cache of the process by name, read by the /metrics route:
+caches = {}
+
+
+class LRUCache:
+    """
+    Thread-safe in-memory cache that evicts the least recently used entry
+    once it holds more than `maxsize` entries.
+    """
+
+    def __init__(self, maxsize=FIGURE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _private_dir(path):
+    """
+    Creates the directory of the disk tier, or checks an existing one: anyone able to write its
+    files could run code within the server (entries are unpickled), so it must belong to the user
+    running the server and be closed to the other users.
+    :param path: Directory of the disk tier.
+    :return: True when the directory can be used.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        stat = os.stat(path)
+        if hasattr(os, 'getuid') and stat.st_uid != os.getuid():
+            logger.warning(f"Figure cache directory {path} belongs to another user, disk tier disabled")
+            return False
+        if stat.st_mode & 0o077:
+            os.chmod(path, 0o700)
+        return True
+    except Exception as e:
+        logger.warning(f"Figure cache directory {path} not usable, disk tier disabled: {str(e)}")
+        return False
+
+
+class DiskCache:
+    """
+    Disk tier shared by the server workers: one pickle file per result, within a directory per
+    version of the dataset. Reading an entry updates its modification time, so once the files
+    take more than `max_bytes`, the ones least recently used are removed first. The directories
+    of the older versions are removed when a new version is published (see drop_versions).
+    """
+
+    def __init__(self, cache_dir, max_bytes=FIGURE_CACHE_DISK_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.enabled = _private_dir(cache_dir)
+        self._lock = threading.Lock()
+
+    def _version_dir(self, version):
+        return os.path.join(self.cache_dir, hashlib.sha256(repr(version).encode('utf-8')).hexdigest()[:16])
+
+    def _path(self, key, version):
+        return os.path.join(self._version_dir(version), hashlib.sha256(repr(key).encode('utf-8')).hexdigest() + '.pkl')
+
+    def get(self, key, version, default=None):
+        path = self._path(key, version)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+            os.utime(path)
+            return value
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable figure cache entry: {str(e)}")
+            return default
+
+    def put(self, key, version, value):
+        try:
+            path = self._path(key, version)
+            os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+            # Write to a temporary file first, so other workers never read a partial entry:
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+            self._evict()
+        except Exception as e:
+            logger.warning(f"Could not write figure cache entry: {str(e)}")
+
+    def _evict(self):
+        # Removes the least recently used files (of any version) until the tier fits in max_bytes:
+        with self._lock:
+            files = []
+            for version in os.scandir(self.cache_dir):
+                if version.is_dir():
+                    for entry in os.scandir(version.path):
+                        if entry.name.endswith('.pkl'):
+                            stat = entry.stat()
+                            files.append((stat.st_mtime, stat.st_size, entry.path))
+            size = sum(file_size for _, file_size, _ in files)
+            for _, file_size, path in sorted(files):
+                if size <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass  # (removed by another worker)
+                size -= file_size
+
+    def drop_versions(self, keep):
+        """
+        Removes the entries of every version of the dataset but one.
+        :param keep: Version of the dataset being served.
+        """
+        if not self.enabled:
+            return
+        keep_dir = self._version_dir(keep)
+        for version in os.scandir(self.cache_dir):
+            if version.is_dir() and version.path != keep_dir:
+                shutil.rmtree(version.path, ignore_errors=True)
+
+
+# Disk tier of the figure caches of this process (None when not configured):
+disk_cache = DiskCache(FIGURE_CACHE_DIR) if FIGURE_CACHE_DIR else None
+
+
+def _freeze(value):
+    """
+    Turns the JSON values received by callbacks (dicts, lists) into hashable keys.
+    """
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def cache_figures(version, maxsize=FIGURE_CACHE_SIZE, disk=disk_cache):
+    """
+    Memoizes a figure-producing callback. Results are keyed on the callback's name,
+    its inputs (month, team, theme...) and the dataset version, kept in an in-memory
+    LRU cache and, when the disk tier is enabled, shared with the other workers on disk.
+    :param version: Function returning the version of the dataset currently served.
+    :param maxsize: Number of results kept in memory.
+    :param disk: DiskCache shared with the other workers (None disables it).
+    :return: Decorator to be placed right below @app.callback.
+    """
+    def decorator(func):
+        cache = caches[f"figure:{func.__name__}"] = LRUCache(maxsize)
+        shared = disk if disk is not None and disk.enabled else None
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            current = version()
+            key = (func.__name__, _freeze(args), current)
+
+            result = cache.get(key, _MISSING)
+            if result is not _MISSING:
+                return result
+
+            if shared is not None:
+                result = shared.get(key, current, _MISSING)
+                if result is not _MISSING:
+                    cache.put(key, result)
+                    return result
+
+            result = func(*args)
+            cache.put(key, result)
+            if shared is not None:
+                shared.put(key, current, result)
+
+            return result
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
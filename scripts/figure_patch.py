@@ -0,0 +1,158 @@
+import logging
+import functools
+
+from dash import Patch, ctx
+from dash.exceptions import MissingCallbackContextException
+
+logger = logging.getLogger(__name__)
+
+# Ways of updating a figure already displayed by the browser:
+FIELDS = 'fields'  # Same traces, only their data fields change (see TRACE_FIELDS)
+TRACES = 'traces'  # The number of traces depends on the selection (e.g. px.line with color), replace them all
+
+# Fields of each trace type that depend on the selected filters. Everything else (layout,
+# template, styling of the traces) is sent once and kept by the browser:
+TRACE_FIELDS = {
+    'pie': (('labels',), ('values',)),
+    'bar': (('x',), ('y',), ('text',)),
+    'scatter': (('x',), ('y',)),
+    'indicator': (('value',), ('title', 'text'), ('delta', 'reference')),
+}
+
+
+def _field(obj, path):
+    """
+    Returns the value found under a path of keys (e.g. ('title', 'text')), None if not set.
+    """
+    for key in path:
+        obj = obj.get(key) if isinstance(obj, dict) else None
+    return obj
+
+
+def _assign(patch, path, value):
+    """
+    Assigns a value under a path of keys of a Patch.
+    """
+    for key in path[:-1]:
+        patch = patch[key]
+    patch[path[-1]] = value
+
+
+def figure_patch(fig, mode=FIELDS, static_annotations=()):
+    """
+    Builds the partial update turning the figure displayed for the previous selection into `fig`.
+    :param fig: Figure built for the current selection.
+    :param mode: FIELDS to assign the data fields of every trace and the annotations' texts
+                 (e.g. the "Média" of charts 3 and 4), TRACES to replace the whole list of traces.
+    :param static_annotations: Positions of the annotations whose text never changes (e.g. the titles
+                               of charts 3 and 4), left out of the update (see AnnotationTexts).
+    :return: dash.Patch with only the changed parts of the figure.
+    """
+    try:
+        figure = fig.to_dict()
+        patch = Patch()
+
+        if mode == TRACES:
+            patch['data'] = figure['data']
+            return patch
+
+        for i, trace in enumerate(figure['data']):
+            for path in TRACE_FIELDS[trace.get('type', 'scatter')]:
+                # Fields not set by this selection (e.g. the value of an indicator without sales)
+                # are assigned None, which clears the value displayed for the previous selection.
+                # Fields under an object the trace does not have (e.g. no delta) are left out:
+                if isinstance(_field(trace, path[:-1]), dict):
+                    _assign(patch['data'][i], path, _field(trace, path))
+
+        for i, annotation in enumerate(figure['layout'].get('annotations', [])):
+            if i not in static_annotations:
+                patch['layout']['annotations'][i]['text'] = annotation.get('text')
+
+        return patch
+
+    except Exception as e:
+        logger.error(f"Error while building the partial update of a figure: {str(e)}")
+        raise
+
+
+class AnnotationTexts:
+    """
+    Texts of the annotations of the figures built for one output, compared with the ones of each
+    new figure to tell the static annotations (titles) from the ones following the selection. The
+    reference is the figure of the page load, which every browser receives in full: an annotation
+    is static while every figure built since then had the same text for it. The texts are kept
+    for one version of the dataset, and recorded again from scratch for the next one.
+    """
+    def __init__(self):
+        self.version = None
+        self.texts = None
+        self.varied = set()
+
+    def static(self, fig, version=None, initial=False):
+        """
+        Records the annotation texts of a new figure.
+        :param fig: Figure built for the current selection.
+        :param version: Version of the dataset the figure was built from.
+        :param initial: Whether the figure is the one of the page load.
+        :return: Set of the positions of the annotations with the same text as in every figure so far.
+        """
+        if version != self.version:
+            self.version, self.texts, self.varied = version, None, set()
+
+        texts = [annotation.text for annotation in fig.layout.annotations]
+        if self.texts is None or len(texts) != len(self.texts):
+            # Without the figure of the page load (or with another layout), nothing is known to be static:
+            if not initial:
+                self.varied.update(range(len(texts)))
+            self.texts = texts
+            return set()
+
+        self.varied.update(i for i, text in enumerate(texts) if text != self.texts[i])
+        return set(range(len(texts))) - self.varied
+
+
+def _is_initial_call():
+    """
+    Tells whether the running callback fills the page for the first time (or runs outside of a request,
+    e.g. from the benchmark), in which case the browser has no figure to be updated yet.
+    """
+    try:
+        return ctx.triggered_id is None
+    except MissingCallbackContextException:
+        return True
+
+
+def partial_updates(*modes, version=None):
+    """
+    Sends the full figures on the first call of a callback (page load) and only their changed
+    parts (see figure_patch) when a filter changes afterwards.
+    :param modes: Mode of each output of the callback, in order (FIELDS, TRACES, or None for
+                  outputs which are always sent as they are, e.g. html components).
+    :param version: Function returning the version of the dataset currently served (the static
+                    annotations are told apart for each version), None for a single version.
+    :return: Decorator to be placed right below @app.callback.
+    """
+    def decorator(func):
+        # Annotations of the figures of each output, recorded from the page load on:
+        annotations = [AnnotationTexts() for _ in modes]
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            current = version() if version is not None else None
+            result = func(*args)
+            outputs = result if len(modes) > 1 else (result,)
+            if _is_initial_call():
+                for output, mode, texts in zip(outputs, modes, annotations):
+                    if mode == FIELDS and (texts.texts is None or texts.version != current):
+                        texts.static(output, current, initial=True)
+                return result
+
+            patched = tuple(output if mode is None else
+                            figure_patch(output, mode, annotations[i].static(output, current) if mode == FIELDS else ())
+                            for i, (output, mode) in enumerate(zip(outputs, modes)))
+
+            return patched if len(modes) > 1 else patched[0]
+
+        return wrapper
+
+    return decorator
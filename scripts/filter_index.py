@@ -0,0 +1,29 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def build_filter_index(df, cols):
+    """
+    Builds a posting list (sorted array of row positions) for every value of the given columns.
+    Must be rebuilt whenever the indexed dataframe changes.
+    :param df: Dataframe to be indexed.
+    :param cols: List of columns used by the dashboard's filters.
+    :return: Dict of {column: {value: row positions}}.
+    """
+    try:
+        return {col: df.groupby(col, observed=True, sort=False).indices for col in cols}
+
+    except Exception as e:
+        logger.error(f"Error while building the filter index: {str(e)}")
+        raise
+
+
+def take_rows(df, positions):
+    """
+    Gathers the filtered rows in a single pass.
+    :param df: Indexed dataframe.
+    :param positions: Row positions returned by query.query_positions (None keeps every row).
+    :return: Filtered dataframe.
+    """
+    return df if positions is None else df.take(positions)
@@ -0,0 +1,70 @@
+# Production serving of the dashboard:
+#     cd scripts && gunicorn -c gunicorn.conf.py
+#
+# The app (datasets, sales cube, filter index, templates) is loaded once by the master process
+# and the workers are forked from it, so they share those read-only buffers copy-on-write
+# instead of each one re-reading the datasets. The columnar dataset is memory-mapped, so its
+# pages are also shared with any other process reading it through the page cache.
+import gc
+import os
+import shutil
+import tempfile
+import multiprocessing
+
+# Scripts use paths relative to this directory (../datasets, ../logging):
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+wsgi_app = 'wsgi:application'
+bind = os.environ.get('DASHBOARD_BIND', '0.0.0.0:8050')
+
+# One worker per core by default; threads serve concurrent callbacks of the same worker:
+workers = int(os.environ.get('DASHBOARD_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('DASHBOARD_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('DASHBOARD_TIMEOUT', 60))
+
+# Load the app in the master before forking the workers:
+preload_app = True
+
+# The workers save their metrics into a shared directory, so /metrics reports the sum over all of
+# them whichever worker answers it (see metrics.py). Unless one is given, a directory of this run is
+# created, and removed when the server stops:
+metrics_dir = os.environ.get('DASHBOARD_METRICS_DIR')
+remove_metrics_dir = metrics_dir is None
+if remove_metrics_dir:
+    metrics_dir = os.environ['DASHBOARD_METRICS_DIR'] = tempfile.mkdtemp(prefix='dashboard-metrics-')
+
+
+def when_ready(server):
+    """
+    Runs in the master once the app is loaded, before the workers are forked.
+    """
+    from wsgi import warm_up
+
+    warm_up()
+
+    # Move every object created so far out of the garbage collector's reach, so the collections
+    # run by the workers do not write to (and copy) the pages shared with the master:
+    gc.collect()
+    gc.freeze()
+    server.log.info(f"Dataset loaded and shared by {workers} workers x {threads} threads")
+
+
+def post_fork(server, worker):
+    """
+    Runs in every worker once forked: each one checks the dataset for new versions on its own.
+    """
+    from metrics import reset_metrics
+    from snapshot import start_reloader
+
+    # The callbacks run by warm_up in the master are not counted by every worker:
+    reset_metrics()
+    start_reloader()
+
+
+def on_exit(server):
+    """
+    Runs in the master when the server stops.
+    """
+    if remove_metrics_dir:
+        shutil.rmtree(metrics_dir, ignore_errors=True)
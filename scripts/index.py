@@ -1,37 +1,34 @@
-import pandas as pd
-from dash import html, dcc, Input, Output
+import time
+import logging
+import threading
+import plotly.io as pio
+from dash import html, dcc, Input, Output, State
 import dash_bootstrap_components as dbc
-from dash_bootstrap_templates import ThemeSwitchAIO
+from dash_bootstrap_templates import ThemeSwitchAIO, load_figure_template
 
 from app import *
 from visualizations_functions import *
 from helper_functions import *
+from constants import MONTHS_MAP, PAYMENT_STATUS_MAP
+from downsampling import points_for_width
+from export import init_export
+from figure_cache import cache_figures
+from figure_patch import partial_updates, FIELDS, TRACES
+from metrics import instrument_callback
+from selection import select_totals, select_ranking
+from snapshot import current_snapshot, start_reloader
 
-# Configure the logger:
-logger = setup_logger('../logging/index.log')
-
-# Import the datasets:
-df_raw = pd.read_csv("../datasets/sales_raw.csv")
-df_final = pd.read_csv("../datasets/sales_analysis.csv")
+logger = logging.getLogger(__name__)
 
 
 # ========================= CREATE LISTS USED BY FILTERS =========================
 
-# Create list of options to be chosen for the month's filter (list of dicts)...
-# First, initialize the list:
-month_options = [{'label': 'Ano inteiro', 'value': 0}]
-# Iterate through the options of month using the above list's structure:
-for i, j in zip(df_raw['Mês'].unique(), df_final['Mês'].unique()):
-    month_options.append({'label': i, 'value': int(j)})
-# Sort the assigned month numbers in ascending order (from 1 to 12):
-month_options = sorted(month_options, key=lambda x: x['value'])
+# Create list of options to be chosen for the month's filter (list of dicts), the months
+# are fixed so they do not depend on reading the datasets (no month checked shows the whole year):
+month_options = [{'label': label, 'value': value} for label, value in MONTHS_MAP.items()]
 
-# Create list of options to be chosen for the teams:
-# First, initialize the list:
-team_options = [{'label': 'All teams', 'value': 0}]
-# Iterate through the list of options to get the individual teams:
-for i in df_final['Equipe'].unique():
-    team_options.append({'label': i, 'value': i})
+# Create list of options to be chosen for the payment status' filter:
+status_options = [{'label': label, 'value': value} for label, value in PAYMENT_STATUS_MAP.items()]
 
 
 # ========================= INSTANTIATE STYLES FOR THE DASH =========================
@@ -52,6 +49,11 @@ main_config = {
     "margin": {"l":10, "r":10, "t":10, "b":10}
 }
 
+# The point budgets of the line charts (points_for_width) take the number of columns of each chart
+# within the layout (lg), see the callbacks below. Those charts are still drawn by day of the month
+# (31 points) or by month (12 points), far below their budgets: nothing is downsampled until a chart
+# is drawn along the date axis ('Data'), which the builders already accept as their x column.
+
 # Config graph to drop button tips on top of each chart:
 config_graph = {"displayModeBar": False, "showTips": False}
 
@@ -61,200 +63,331 @@ template_theme2 = "darkly"
 url_theme1 = dbc.themes.FLATLY
 url_theme2 = dbc.themes.DARKLY
 
+# Plotly templates of both themes, sent once to the browser with the layout (see start_up):
+theme_templates = None
+
 
 # ========================= CONSTRUCT THE APP'S LAYOUT =========================
 
-# Define the app's layout:
-app.layout = dbc.Container(
-    children = [
-        # Construct 1st row of the dashboard's layout:
-        dbc.Row([
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        # Add the first row to the card:
-                        dbc.Row([
-                            dbc.Col([
-                                html.Legend("Sales Analytics")
-                            ], sm=8),
-                            dbc.Col([
-                                html.I(className='fa fa-balance-scale', style={'font-size': '300%'})
-                            ], sm=4, align="center")
-                        ]),
-                        dbc.Row([
-                            dbc.Col([
-                                ThemeSwitchAIO(aio_id="theme", themes=[url_theme1, url_theme2]),
-                                html.Legend("Provided by ADATA")
-                            ])
-                        ], style={'margin-top': '10px'}),
-                        # Add another row to the card:
-                        dbc.Row([
-                            dbc.Button("Linkedin", href="https://www.linkedin.com/in/renan-pacheco-301324aa/",
-                                       target="_blank")  #Opens a new tab
-                        ], style={'margin-top': '10px'})
-                    ])
-                ], style=tab_card)
-            ], sm=4, lg=2),
-            # Add the first space where a bar chart will be located...
-            # Create a new column where the chart will be added:
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        dbc.Row(
-                            dbc.Col(
-                                dbc.Col(html.Legend("Top Consultores por Equipe"))
-                            )
-                        ),
-                        dbc.Row([
-                            dbc.Col([
-                                # Add the first graph, name(id) to be called later by callbacks and
-                                # add classname in order to be editable by themeswicher:
-                                dcc.Graph(id='graph1', className='dbc', config=config_graph)
-                            ], sm=12, md=7),
-                            dbc.Col([
-                                dcc.Graph(id='graph2', className='dbc', config=config_graph)
-                            ], sm=12, md=5)
+def build_layout(snapshot):
+    """
+    Builds the app's layout. The filters list the teams and channels of the dataset and the
+    calendar opens on its first month, so a layout is built for each version of the dataset
+    (see serve_layout).
+    :param snapshot: Snapshot of the dataset (see snapshot.current_snapshot).
+    :return: Layout of the dashboard.
+    """
+    # Create list of options to be chosen for the teams (no team checked shows all teams):
+    # First, initialize the list:
+    team_options = []
+    # Iterate through the list of options to get the individual teams:
+    for i in snapshot.store.values('Equipe'):
+        team_options.append({'label': i, 'value': i})
+
+    # Create list of options to be chosen for the marketing channels:
+    channel_options = [{'label': i, 'value': i} for i in sorted(snapshot.store.values('Meio de Propaganda'))]
+
+    # Open the calendar of the date range filter on the first month of the dataset:
+    first_date = snapshot.store.first_date()
+
+    return dbc.Container(
+        children = [
+            # Construct 1st row of the dashboard's layout:
+            dbc.Row([
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            # Add the first row to the card:
+                            dbc.Row([
+                                dbc.Col([
+                                    html.Legend("Sales Analytics")
+                                ], sm=8),
+                                dbc.Col([
+                                    html.I(className='fa fa-balance-scale', style={'font-size': '300%'})
+                                ], sm=4, align="center")
+                            ]),
+                            dbc.Row([
+                                dbc.Col([
+                                    ThemeSwitchAIO(aio_id="theme", themes=[url_theme1, url_theme2]),
+                                    html.Legend("Provided by ADATA")
+                                ])
+                            ], style={'margin-top': '10px'}),
+                            # Add another row to the card:
+                            dbc.Row([
+                                dbc.Button("Linkedin", href="https://www.linkedin.com/in/renan-pacheco-301324aa/",
+                                           target="_blank")  #Opens a new tab
+                            ], style={'margin-top': '10px'})
                         ])
-                    ])
-                ], style=tab_card)
-            ], sm=12, lg=7),
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        dbc.Row(
-                            dbc.Col([
-                                html.H5("Escolha o mês"),
-                                dbc.RadioItems(
-                                    id = 'radio-month',
-                                    options = month_options,
-                                    value = 0,  #By default, all months are selected
-                                    inline = True,
-                                    labelCheckedClassName = "text-success", #If checked, color it green
-                                    inputCheckedClassName = "border border-success bg-success"
-                                ),
-                                html.Div(
-                                    id='month-select',
-                                    style={'style-align': 'center', 'margin-top': '30px'},
-                                    className='dbc'
+                    ], style=tab_card)
+                ], sm=4, lg=2),
+                # Add the first space where a bar chart will be located...
+                # Create a new column where the chart will be added:
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            dbc.Row(
+                                dbc.Col(
+                                    dbc.Col(html.Legend("Top Consultores por Equipe"))
                                 )
+                            ),
+                            dbc.Row([
+                                dbc.Col([
+                                    # Add the first graph, name(id) to be called later by callbacks and
+                                    # add classname in order to be editable by themeswicher:
+                                    dcc.Graph(id='graph1', className='dbc', config=config_graph)
+                                ], sm=12, md=7),
+                                dbc.Col([
+                                    dcc.Graph(id='graph2', className='dbc', config=config_graph)
+                                ], sm=12, md=5)
                             ])
-                        )
-                    ])
-                ], style=tab_card)
-            ], sm=12, lg=3)
-        ], className='g-2 my-auto', style={'margin-top': '7px'}),
-
-        # Construct 2nd row of the dashboard's layout:
-        dbc.Row([
-            dbc.Col([
-                dbc.Row([
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                dcc.Graph(id='graph3', className='dbc', config=config_graph)
-                            ])
-                        ], style=tab_card)
-                    ])
-                ]),
-                dbc.Row([
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                dcc.Graph(id='graph4', className='dbc', config=config_graph)
-                            ])
-                        ], style=tab_card)
-                    ])
-                ], className='g-2 my-auto', style={'margin-top': '7px'})
-            ], sm=12, lg=5),
-            dbc.Col([
-                dbc.Row([
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                # Slot for indicator number 1
-                                dcc.Graph(id='graph5', className='dbc', config=config_graph)
-                            ])
-                        ], style=tab_card)
-                    ], sm=6),
-                    dbc.Col([
-                        dbc.Card([
-                            dbc.CardBody([
-                                # Slot for indicator number 2
-                                dcc.Graph(id='graph6', className='dbc', config=config_graph)
-                            ])
-                        ], style=tab_card)
-                    ], sm=6)
-                ], className='g-2'),
-                dbc.Row([
-                    dbc.Col([
-                        dbc.Card([
-                            dcc.Graph(id='graph7', className='dbc', config=config_graph)
-                        ], style=tab_card)
-                    ])
-                ], className='g-2 my-auto', style={'margin-top': '7px'})
-            ], sm=12, lg=4),
-             # Add the 3rd and last column of the layout for the middle row:
-            dbc.Col([
-                dbc.Card([
-                    dcc.Graph(id='graph8', className='dbc', config=config_graph)
-                ], style=tab_card)  #Define style for tabcard of graph 8
-            ], sm=12, lg=3)
-        ],  className='g-2 my-auto', style={'margin-top': '7px'}),
-
-        # Construct 3rd row of the dashboard's layout:
-        dbc.Row([
-            # Add the first column:
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        html.H4("Distribuição de Propaganda"),
-                        dcc.Graph(id='graph9', className='dbc', config=config_graph)
-                    ])
-                ], style=tab_card)
-            ], sm=12, lg=2),
-            # Add the second column:
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        html.H4("Valores de Propaganda Convertidos por Mês"),
-                        dcc.Graph(id='graph10', className='dbc', config=config_graph)
-                    ])
-                ], style=tab_card)  #Get 100% of rows' length
-            ], sm=12, lg=5),
-            # Add the third column:
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        dcc.Graph(id='graph11', className='dbc', config=config_graph)
-                    ])
-                ], style=tab_card)
-            ], sm=12, lg=3),
-            # Add fourth and final column:
-            dbc.Col([
-                dbc.Card([
-                    dbc.CardBody([
-                        html.H5("Escolha a equipe:"),
-                        dbc.RadioItems(
-                            id = 'radio-team',
-                            options = team_options,
-                            value = 0,
-                            inline = True,
-                            labelCheckedClassName = 'text-warning',
-                            inputCheckedClassName = 'border border-warning bg-warning'
-                        ),
-                        html.Div(
-                            id = 'team-select',
-                            style = {'text-align': 'center', 'margin-top': '30px'},
-                            className = 'dbc'
-                        )
-                    ])
-                ], style=tab_card)
-            ], sm=12, lg=2)
-        ], className='g-2 my-auto', style={'margin-top': '7px'})
-    ],
-    fluid = True,
-    style = {'height': '100vh'}
-)
+                        ])
+                    ], style=tab_card)
+                ], sm=12, lg=7),
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            dbc.Row(
+                                dbc.Col([
+                                    html.H5("Escolha o mês"),
+                                    dbc.Checklist(
+                                        id = 'check-month',
+                                        options = month_options,
+                                        value = [],  #By default, no month is checked: all months are shown
+                                        inline = True,
+                                        labelCheckedClassName = "text-success", #If checked, color it green
+                                        inputCheckedClassName = "border border-success bg-success"
+                                    ),
+                                    html.H5("Escolha o período", style={'margin-top': '15px'}),
+                                    dcc.DatePickerRange(
+                                        id = 'date-range',
+                                        # No dates by default: the range stays open and follows the dataset
+                                        # as new days are ingested.
+                                        start_date = None,
+                                        end_date = None,
+                                        initial_visible_month = first_date,
+                                        display_format = 'DD/MM/YYYY',
+                                        start_date_placeholder_text = 'Início',
+                                        end_date_placeholder_text = 'Fim',
+                                        clearable = True,
+                                        className = 'dbc'
+                                    ),
+                                    html.Div(
+                                        id='month-select',
+                                        style={'style-align': 'center', 'margin-top': '30px'},
+                                        className='dbc'
+                                    )
+                                ])
+                            )
+                        ])
+                    ], style=tab_card)
+                ], sm=12, lg=3)
+            ], className='g-2 my-auto', style={'margin-top': '7px'}),
+
+            # Construct 2nd row of the dashboard's layout:
+            dbc.Row([
+                dbc.Col([
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardBody([
+                                    dcc.Graph(id='graph3', className='dbc', config=config_graph)
+                                ])
+                            ], style=tab_card)
+                        ])
+                    ]),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardBody([
+                                    dcc.Graph(id='graph4', className='dbc', config=config_graph)
+                                ])
+                            ], style=tab_card)
+                        ])
+                    ], className='g-2 my-auto', style={'margin-top': '7px'})
+                ], sm=12, lg=5),
+                dbc.Col([
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardBody([
+                                    # Slot for indicator number 1
+                                    dcc.Graph(id='graph5', className='dbc', config=config_graph)
+                                ])
+                            ], style=tab_card)
+                        ], sm=6),
+                        dbc.Col([
+                            dbc.Card([
+                                dbc.CardBody([
+                                    # Slot for indicator number 2
+                                    dcc.Graph(id='graph6', className='dbc', config=config_graph)
+                                ])
+                            ], style=tab_card)
+                        ], sm=6)
+                    ], className='g-2'),
+                    dbc.Row([
+                        dbc.Col([
+                            dbc.Card([
+                                dcc.Graph(id='graph7', className='dbc', config=config_graph)
+                            ], style=tab_card)
+                        ])
+                    ], className='g-2 my-auto', style={'margin-top': '7px'})
+                ], sm=12, lg=4),
+                 # Add the 3rd and last column of the layout for the middle row:
+                dbc.Col([
+                    dbc.Card([
+                        dcc.Graph(id='graph8', className='dbc', config=config_graph)
+                    ], style=tab_card)  #Define style for tabcard of graph 8
+                ], sm=12, lg=3)
+            ],  className='g-2 my-auto', style={'margin-top': '7px'}),
+
+            # Construct 3rd row of the dashboard's layout:
+            dbc.Row([
+                # Add the first column:
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.H4("Distribuição de Propaganda"),
+                            dcc.Graph(id='graph9', className='dbc', config=config_graph)
+                        ])
+                    ], style=tab_card)
+                ], sm=12, lg=2),
+                # Add the second column:
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.H4("Valores de Propaganda Convertidos por Mês"),
+                            dcc.Graph(id='graph10', className='dbc', config=config_graph)
+                        ])
+                    ], style=tab_card)  #Get 100% of rows' length
+                ], sm=12, lg=5),
+                # Add the third column:
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            dcc.Graph(id='graph11', className='dbc', config=config_graph)
+                        ])
+                    ], style=tab_card)
+                ], sm=12, lg=3),
+                # Add fourth and final column:
+                dbc.Col([
+                    dbc.Card([
+                        dbc.CardBody([
+                            html.H5("Escolha a equipe:"),
+                            dbc.Checklist(
+                                id = 'check-team',
+                                options = team_options,
+                                value = [],
+                                inline = True,
+                                labelCheckedClassName = 'text-warning',
+                                inputCheckedClassName = 'border border-warning bg-warning'
+                            ),
+                            html.H5("Meio de Propaganda:", style={'margin-top': '15px'}),
+                            dbc.Checklist(
+                                id = 'check-channel',
+                                options = channel_options,
+                                value = [],
+                                inline = True,
+                                labelCheckedClassName = 'text-info',
+                                inputCheckedClassName = 'border border-info bg-info'
+                            ),
+                            html.H5("Status de Pagamento:", style={'margin-top': '15px'}),
+                            dbc.Checklist(
+                                id = 'check-status',
+                                options = status_options,
+                                value = [],
+                                inline = True,
+                                labelCheckedClassName = 'text-info',
+                                inputCheckedClassName = 'border border-info bg-info'
+                            ),
+                            html.Div(
+                                id = 'team-select',
+                                style = {'text-align': 'center', 'margin-top': '30px'},
+                                className = 'dbc'
+                            )
+                        ])
+                    ], style=tab_card)
+                ], sm=12, lg=2)
+            ], className='g-2 my-auto', style={'margin-top': '7px'}),
+
+            # Keep both figure templates within the page, so the theme switch is applied by the browser:
+            dcc.Store(id='theme-templates', data=theme_templates)
+        ],
+        fluid = True,
+        style = {'height': '100vh'}
+    )
+
+# ========================= START THE APP UP =========================
+
+# Layout of the dashboard, as (version of the dataset it was built from, layout), first built in the
+# background by start_up:
+_layout = None
+_ready = threading.Event()
+
+
+def start_up():
+    """
+    Does the slow part of the startup (loading the dataset, registering the figure templates and
+    building the layout) once the module is imported, in a background thread, so the server starts
+    listening right away. Requests wait for it to be done (see wait_until_ready).
+    """
+    global _layout, theme_templates
+
+    try:
+        start = time.perf_counter()
+        snapshot = current_snapshot()
+
+        load_figure_template([template_theme1, template_theme2])
+        theme_templates = {template: pio.templates[template].to_plotly_json()
+                           for template in (template_theme1, template_theme2)}
+
+        _layout = (snapshot.version, build_layout(snapshot))
+        logger.info(f"Dashboard ready in {time.perf_counter() - start:.2f}s")
+
+    except Exception as e:
+        logger.error(f"Error while starting the dashboard up: {str(e)}")
+        raise
+
+    finally:
+        _ready.set()
+
+
+def wait_until_ready():
+    """
+    Blocks until start_up is done. Callbacks and layout must not be served before it, as they
+    need the dataset and the figure templates.
+    """
+    _ready.wait()
+    if _layout is None:
+        raise RuntimeError("The dashboard failed to start, see the logs")
+
+
+def serve_layout():
+    """
+    Returns the layout of the snapshot being served, built again once the dataset is reloaded
+    (new teams, channels or dates), and reused by every page load until then.
+    """
+    global _layout
+
+    wait_until_ready()
+    snapshot = current_snapshot()
+    version, layout = _layout
+    if version != snapshot.version:
+        layout = build_layout(snapshot)
+        _layout = (snapshot.version, layout)
+    return layout
+
+
+# The layout is a function, so it is not built on import, and it is only known once the dataset is
+# loaded: the callbacks are not checked against it by Dash.
+app.config.suppress_callback_exceptions = True
+app.layout = serve_layout
+server.before_request(wait_until_ready)
+
+# Stream the rows behind the dashboard's filters on /export:
+init_export(server)
+
+threading.Thread(target=start_up, name='dashboard-startup', daemon=True).start()
+
 
 # ========================= CONSTRUCT THE CALLBACKS =========================
 
@@ -263,42 +396,60 @@ app.layout = dbc.Container(
     Output(component_id = 'graph1', component_property = 'figure'),
     Output(component_id = 'graph2', component_property = 'figure'),
     Output(component_id = 'month-select', component_property = 'children'),
-    Input (component_id = 'radio-month', component_property = 'value'),  #Receives the month selected from radio
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-month', component_property = 'value'),  #Receives the months checked
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the 1st and 2nd charts
-def graph1_and_2 (month, toggle):
+@partial_updates(FIELDS, FIELDS, None, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph1_and_2 (months, channels, statuses, start, end, toggle):
     """
     Creates charts 1 and 2 of the dashboard.
-    :param month: Month selected by user to filter the charts.
+    :param months: Months checked by user to filter the charts (none keeps all months).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figures of charts 1 and 2.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
-
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
+
+        # Get the consultants' totals of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Consultor', 'Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
+        # Get the consultants' ranking of the selection (shared with indicator 1)
+        ranking = select_ranking(snapshot.store, snapshot.version, ['Consultor', 'Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
 
         # Call function to create the pie chart:
         fig2 = pie_consultant_by_team(df = df_graph,
                                       cols_to_group = ['Consultor', 'Equipe'],
-                                      value = 'Valor Pago')
+                                      value = 'Valor Pago',
+                                      ranking = ranking)
         # Call function to create the bar chart:
         fig1 = bar_consultant_by_team(df = df_graph,
                                       cols_to_group = ['Consultor', 'Equipe'],
-                                      value = 'Valor Pago')
+                                      value = 'Valor Pago',
+                                      ranking = ranking)
 
         # Update figure's layouts:
         fig1.update_layout(main_config, height=200, template=template)
         fig2.update_layout(main_config, height=200, template=template, showlegend=False)
 
-        # Display on the screen the month selected by the radio:
-        select = html.H1(convert_to_text(month))
+        # Display on the screen the months checked:
+        select = html.H1(convert_to_text(months)) if len(months) <= 1 else html.H4(convert_to_text(months))
 
         return fig1, fig2, select
 
@@ -311,39 +462,47 @@ def graph1_and_2 (month, toggle):
 # Construct second callback for chart 3 (ref. 2nd line)
 @app.callback(
     Output(component_id = 'graph3', component_property = 'figure'),
-    Input (component_id = 'radio-team', component_property = 'value'),
-    Input (component_id = 'radio-month', component_property = 'value'),  #Receives the month selected from radio
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-team', component_property = 'value'),
+    Input (component_id = 'check-month', component_property = 'value'),  #Receives the months checked
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the 3rd chart
-def graph3(team, month, toggle):
+@partial_updates(FIELDS, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph3(teams, months, channels, statuses, start, end, toggle):
     """
     Creates chart 3 the dashboard.
-    :param team: Team selected by user to filter the charts.
-    :param month: Month selected by user to filter the charts.
+    :param teams: Teams checked by user to filter the charts (none keeps all teams).
+    :param months: Months checked by user to filter the charts (none keeps all months).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figure of chart 3.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Equipe': teams, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
-
-        # Call function to return the mask for the selected team
-        team_mask = team_filter(df=df_final, reference_col='Equipe', team=team)
-
-        # Create auxiliary df to return only the selected teams
-        df_graph = df_graph.loc[team_mask]
+        # Get the calls by day of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Dia'], 'Chamadas Realizadas',
+                                 filters, start=start, end=end)
 
         # Call function to create the scatter chart
         fig3 = scatter_calls_by_day(df = df_graph,
                                     cols_to_group = 'Dia',
-                                    value = 'Chamadas Realizadas')
+                                    value = 'Chamadas Realizadas',
+                                    max_points = points_for_width(5))
 
         # Update figure's layouts
         fig3.update_layout(main_config, height=180, template=template)
@@ -360,31 +519,45 @@ def graph3(team, month, toggle):
 # Construct third callback for chart 4 (ref. 2nd line)
 @app.callback(
     Output(component_id = 'graph4', component_property = 'figure'),
-    Input (component_id = 'radio-team', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-team', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the 4th chart
-def graph4(team, toggle):
+@partial_updates(FIELDS, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph4(teams, channels, statuses, start, end, toggle):
     """
     Creates chart 4 the dashboard.
-    :param team: Team selected by user to filter the charts.
+    :param teams: Teams checked by user to filter the charts (none keeps all teams).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figure of chart 4.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Equipe': teams, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected team
-        team_mask = team_filter(df=df_final, reference_col='Equipe', team=team)
-
-        # Create auxiliary df to return only the selected teams
-        df_graph = df_final.loc[team_mask]
+        # Get the calls by month of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Mês'], 'Chamadas Realizadas',
+                                 filters, start=start, end=end)
 
         # Call function to create the scatter chart
         fig4 = scatter_calls_by_month(df = df_graph,
                                       cols_to_group = 'Mês',
-                                      value = 'Chamadas Realizadas')
+                                      value = 'Chamadas Realizadas',
+                                      max_points = points_for_width(5))
 
         # Update figure's layouts
         fig4.update_layout(main_config, height=180, template=template)
@@ -402,31 +575,48 @@ def graph4(team, toggle):
 @app.callback(
     Output(component_id = 'graph5', component_property = 'figure'),
     Output(component_id = 'graph6', component_property = 'figure'),
-    Input (component_id = 'radio-month', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-month', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the indicators 1 and 2
-def indicator1_and_2(month, toggle):
+@partial_updates(FIELDS, FIELDS, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def indicator1_and_2(months, channels, statuses, start, end, toggle):
     """
     Creates indicators 1 and 2 of the dashboard.
-    :param month: Month selected by user to filter the charts.
+    :param months: Months checked by user to filter the charts (none keeps all months).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figures of indicators 1 and 2.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
-
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
+
+        # Get the teams' totals of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
+        # Get the consultants' ranking of the selection (shared with charts 1 and 2)
+        ranking = select_ranking(snapshot.store, snapshot.version, ['Consultor', 'Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
 
         # Call function to create indicator 1:
         fig5 = kpi_best_consultant(df = df_graph,
                                    cols_to_group = ['Consultor', 'Equipe'],
-                                   value = 'Valor Pago')
+                                   value = 'Valor Pago',
+                                   ranking = ranking)
 
         # Call function to create indicator 2
         fig6 = kpi_best_team(df = df_graph,
@@ -451,26 +641,33 @@ def indicator1_and_2(month, toggle):
 # Construct fifth callback for chart 5 (ref. 2nd line)
 @app.callback(
     Output(component_id = 'graph7', component_property = 'figure'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'theme-templates', component_property = 'data'),  #Chart 5 has no filters, only built on page load
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the chart number 5
-def graph5(toggle):
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph5(templates, toggle):
     """
     Creates chart number 5 of the dashboard.
+    :param templates: Figure templates stored within the page (only used to trigger the callback).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figures of chart number 5.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
 
-        # Create auxiliary df to return only the selected months
-        # df_graph = df_final.copy()
+        # Get the teams' totals by month of the whole dataset (no filters applied)
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Mês', 'Equipe'], 'Valor Pago')
 
         # Call function to create chart number 5
-        fig7 = scatter_sales_month_teams(df = df_final,
+        fig7 = scatter_sales_month_teams(df = df_graph,
                                          cols_to_group = ['Mês', 'Equipe'],
-                                         value = 'Valor Pago')
+                                         value = 'Valor Pago',
+                                         max_points = points_for_width(4))
 
         # Update figure's layouts
         fig7.update_layout(main_config,
@@ -492,27 +689,39 @@ def graph5(toggle):
 # Construct sixth callback for chart 6 (ref. 2nd line)
 @app.callback(
     Output(component_id = 'graph8', component_property = 'figure'),
-    Input (component_id = 'radio-month', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-month', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the chart number 6
-def graph6(month, toggle):
+@partial_updates(FIELDS, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph6(months, channels, statuses, start, end, toggle):
     """
     Creates chart 6 the dashboard.
-    :param team: Team selected by user to filter the charts. ???????
-    :param month: Month selected by user to filter the charts.
+    :param months: Months checked by user to filter the charts (none keeps all months).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figure of chart 6.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
+        # Get the teams' totals of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
 
         # Call function to create chart number 6:
         fig8 = bar_sales_by_team(df = df_graph,
@@ -534,32 +743,42 @@ def graph6(month, toggle):
 # Construct seventh callback for chart 7 (ref. 3rd line)
 @app.callback(
     Output(component_id = 'graph9', component_property = 'figure'),
-    Input (component_id = 'radio-month', component_property = 'value'),
-    Input (component_id = 'radio-team', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-month', component_property = 'value'),
+    Input (component_id = 'check-team', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the chart number 7:
-def graph7(month, team, toggle):
+@partial_updates(FIELDS, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph7(months, teams, channels, statuses, start, end, toggle):
     """
     Creates chart 7 the dashboard.
-    :param team: Team selected by user to filter the charts.
-    :param month: Month selected by user to filter the charts.
+    :param teams: Teams checked by user to filter the charts (none keeps all teams).
+    :param months: Months checked by user to filter the charts (none keeps all months).
+    :param channels: Marketing channels checked by user to filter the charts (none keeps all channels).
+    :param statuses: Payment statuses checked by user to filter the charts (none keeps both).
+    :param start: First date selected by user to filter the charts (None when not chosen).
+    :param end: Last date selected by user to filter the charts (None when not chosen).
     :param toggle: Changes theme of dashboard (from dark to light and vice versa).
     :return: Figure of chart 7.
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Equipe': teams,
+                   'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
-
-        # Call function to return the mask for the selected team
-        team_mask = team_filter(df=df_final, reference_col='Equipe', team=team)
-        # Create auxiliary df to return only the selected teams
-        df_graph = df_graph.loc[team_mask]
+        # Get the channels' totals of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Meio de Propaganda', 'Equipe'],
+                                 'Valor Pago', filters, start=start, end=end)
 
         # Call function to create the scatter chart
         fig9 = paym_by_channel(df = df_graph,
@@ -581,31 +800,45 @@ def graph7(month, team, toggle):
 # Construct eighth callback for chart 8 (ref. 3rd line)
 @app.callback(
     Output(component_id = 'graph10', component_property = 'figure'),
-    Input (component_id = 'radio-team', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-team', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the chart number 8:
-def graph8(team, toggle):
+@partial_updates(TRACES, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def graph8(teams, channels, statuses, start, end, toggle):
     """
 
-    :param team:
+    :param teams:
+    :param channels:
+    :param statuses:
+    :param start:
+    :param end:
     :param toggle:
     :return:
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Equipe': teams, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected team
-        team_mask = team_filter(df=df_final, reference_col='Equipe', team=team)
-
-        # Create auxiliary df to return only the selected teams
-        df_graph = df_final.loc[team_mask]
+        # Get the channels' totals by month of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Meio de Propaganda', 'Mês'], 'Valor Pago',
+                                 filters, start=start, end=end)
 
         # Call function to create the scatter chart
         fig10 = paym_by_channel_over_months(df = df_graph,
                                             cols_to_group = ['Meio de Propaganda', 'Mês'],
-                                            value = 'Valor Pago')
+                                            value = 'Valor Pago',
+                                            max_points = points_for_width(5))
 
         # Update figure's layouts
         fig10.update_layout(main_config, height = 360, template = template, showlegend = False)
@@ -626,32 +859,41 @@ def graph8(team, toggle):
 @app.callback(
     Output(component_id = 'graph11', component_property = 'figure'),
     Output(component_id = 'team-select', component_property = 'children'),
-    Input (component_id = 'radio-month', component_property = 'value'),
-    Input (component_id = 'radio-team', component_property = 'value'),
-    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
+    Input (component_id = 'check-month', component_property = 'value'),
+    Input (component_id = 'check-team', component_property = 'value'),
+    Input (component_id = 'check-channel', component_property = 'value'),
+    Input (component_id = 'check-status', component_property = 'value'),
+    Input (component_id = 'date-range', component_property = 'start_date'),
+    Input (component_id = 'date-range', component_property = 'end_date'),
+    State (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value')
 )
 # Define the function to plot the indicator number 3:
-def indicator3(month, team, toggle):
+@partial_updates(FIELDS, None, version=lambda: current_snapshot().version)
+@instrument_callback
+@cache_figures(version=lambda: current_snapshot().version)
+def indicator3(months, teams, channels, statuses, start, end, toggle):
     """
 
-    :param month:
-    :param team:
+    :param months:
+    :param teams:
+    :param channels:
+    :param statuses:
+    :param start:
+    :param end:
     :param toggle:
     :return:
     """
     try:
         # Define change rule for template
         template = template_theme1 if toggle else template_theme2
+        # Serve the whole callback from the same version of the dataset, even if a reload happens meanwhile:
+        snapshot = current_snapshot()
+        # Combine the values checked within the filters (a filter without any value checked keeps every value):
+        filters = {'Mês': months, 'Equipe': teams, 'Meio de Propaganda': channels, 'Status de Pagamento': statuses}
 
-        # Call function to return the mask for the selected month
-        month_mask = month_filter(df=df_final, reference_col='Mês', month=month)
-        # Create auxiliary df to return only the selected months
-        df_graph = df_final.loc[month_mask]
-
-        # Call function to return the mask for the selected team
-        team_mask = team_filter(df=df_final, reference_col='Equipe', team=team)
-        # Create auxiliary df to return only the selected teams
-        df_graph = df_graph.loc[team_mask]
+        # Get the teams' totals of the selection, read from the data-access store
+        df_graph = select_totals(snapshot.store, snapshot.version, ['Equipe'], 'Valor Pago',
+                                 filters, start=start, end=end)
 
         # Call function to create the scatter chart
         fig11 = total_sales(df = df_graph, value = 'Valor Pago')
@@ -659,8 +901,13 @@ def indicator3(month, team, toggle):
         # Update figure's layouts
         fig11.update_layout(main_config, height = 300, template = template)
 
-        # Display on the screen the team selected by the radio:
-        select_team = html.H1("Todas as equipes") if team == 0 else html.H1(team)
+        # Display on the screen the teams checked:
+        if not teams:
+            select_team = html.H1("Todas as equipes")
+        elif len(teams) == 1:
+            select_team = html.H1(teams[0])
+        else:
+            select_team = html.H4(', '.join(sorted(teams)))
 
         return fig11, select_team
 
@@ -669,9 +916,32 @@ def indicator3(month, team, toggle):
         raise
 
 
+# ===============================================
+
+# Construct the theme callback, run by the browser: it only swaps the template of the figures
+# already displayed, so a theme flip costs no aggregation on the server and re-sends no data.
+app.clientside_callback(
+    """
+    function(toggle, templates, ...figures) {
+        const template = templates[toggle ? '%s' : '%s'];
+        return figures.map(fig => fig ? {...fig, layout: {...fig.layout, template: template}}
+                                      : window.dash_clientside.no_update);
+    }
+    """ % (template_theme1, template_theme2),
+    [Output(component_id = f'graph{i}', component_property = 'figure', allow_duplicate = True)
+     for i in range(1, 12)],
+    Input (component_id = ThemeSwitchAIO.ids.switch('theme'), component_property = 'value'),
+    State (component_id = 'theme-templates', component_property = 'data'),
+    [State(component_id = f'graph{i}', component_property = 'figure') for i in range(1, 12)],
+    prevent_initial_call = True
+)
+
+
 # ===========================================================================
 
 
 # Run the app:
 if __name__ == '__main__':
+    # Pick up new versions of the cleaned dataset without restarting the server:
+    start_reloader()
     app.run_server(debug=True, port=8051)
@@ -0,0 +1,101 @@
+import os
+import argparse
+import logging
+import pandas as pd
+
+from aggregates import AGGREGATES_DIR, OPTION_COLUMNS, add_option_values, append_aggregates, is_current
+from data_access import SALES_DATABASE, append_sales_database
+from data_loader import CLEAN_DATASET, COLUMNAR_DATASET, SCHEMA_FILE, append_columnar, is_up_to_date
+from data_preprocessing import (CHUNK_SIZE, DEFAULT_YEAR, REJECTS_DATASET, clean_sales_data, read_raw_chunks,
+                                validate_sales_data)
+from logging_config import setup_logging
+from sales_cube import CUBE_DATASET, add_sales_cube, append_sales_cube, build_sales_cube, merge_sales_cubes
+
+logger = logging.getLogger(__name__)
+
+
+def ingest_sales(input_path, csv_path=CLEAN_DATASET, columnar_path=COLUMNAR_DATASET,
+                 cube_path=CUBE_DATASET, chunksize=CHUNK_SIZE, year=DEFAULT_YEAR, db_path=SALES_DATABASE,
+                 aggregates_path=AGGREGATES_DIR, rejects_path=REJECTS_DATASET):
+    """
+    Cleans a file of new raw sales rows and appends them to the stored dataset: the cleaned
+    CSV, the columnar copy and the SQLite database receive the new rows, and the cells of the
+    sales cube and the aggregate tables built from the new rows only are appended to the stored
+    ones (they are merged when read). Nothing already stored is read or rewritten, so the cost
+    of a refresh depends on the size of the delta and not on the whole history. Rows failing
+    the validation are appended to the reject file instead.
+    Copies that are missing or already outdated are left alone (the dashboard rebuilds
+    them from the cleaned CSV).
+    :param input_path: Path of the raw file with the new rows (same layout of sales_raw.csv).
+    :param csv_path: Path of the cleaned dataset.
+    :param columnar_path: Directory of the columnar dataset.
+    :param cube_path: Path of the sales cube.
+    :param chunksize: Number of raw rows cleaned at a time.
+    :param year: Year of the new rows, used when the raw file has no year column.
+    :param db_path: Path of the SQLite database.
+    :param aggregates_path: Directory of the aggregate tables.
+    :param rejects_path: Path of the reject file.
+    :return: Number of rows ingested.
+    """
+    try:
+        # Only copies in sync with the cleaned dataset can receive the delta:
+        update_columnar = is_up_to_date(f"{columnar_path}/{SCHEMA_FILE}", csv_path)
+        update_cube = is_up_to_date(cube_path, csv_path)
+        update_database = is_up_to_date(db_path, csv_path)
+        update_aggregates = is_current(aggregates_path, csv_path)
+
+        columns = pd.read_csv(csv_path, nrows=0).columns
+        rows = 0
+        # Cubes of the new rows, chunk by chunk, and values of the filters found within them:
+        cubes, values = [], {col: [] for col in OPTION_COLUMNS}
+
+        for chunk in read_raw_chunks(input_path, chunksize):
+            chunk, rejects = validate_sales_data(chunk, year, source=input_path)
+            if len(rejects):
+                rejects.to_csv(rejects_path, index=False, mode='a', header=not os.path.exists(rejects_path))
+            chunk = clean_sales_data(chunk, year)[columns]
+            chunk.to_csv(csv_path, index=False, mode='a', header=False)
+            if update_columnar:
+                try:
+                    append_columnar(chunk, columnar_path)
+                except ValueError as e:
+                    # The new rows do not fit the stored column types: leave the copy outdated.
+                    logger.warning(f"Columnar dataset not updated ({str(e)})")
+                    update_columnar = False
+            if update_cube or update_aggregates:
+                add_sales_cube(cubes, build_sales_cube(chunk))
+                add_option_values(values, chunk)
+            if update_database:
+                append_sales_database(chunk, db_path)
+            rows += len(chunk)
+
+        delta = merge_sales_cubes(cubes)
+        if update_cube:
+            append_sales_cube(delta, cube_path)
+        if update_aggregates:
+            append_aggregates(delta, values, csv_path, aggregates_path)
+
+        return rows
+
+    except Exception as e:
+        logger.error(f"Error while ingesting {input_path}: {str(e)}")
+        raise
+
+
+if __name__ == '__main__':
+    setup_logging()
+    parser = argparse.ArgumentParser(description="Append new raw sales rows to the cleaned dataset.")
+    parser.add_argument('input', help="Raw file with the new rows.")
+    parser.add_argument('--output', default=CLEAN_DATASET, help="Path of the cleaned dataset.")
+    parser.add_argument('--columnar', default=COLUMNAR_DATASET, help="Directory of the columnar dataset.")
+    parser.add_argument('--rejects', default=REJECTS_DATASET, help="Path of the file of the rejected raw rows.")
+    parser.add_argument('--cube', default=CUBE_DATASET, help="Path of the sales cube.")
+    parser.add_argument('--database', default=SALES_DATABASE, help="Path of the SQLite database.")
+    parser.add_argument('--aggregates', default=AGGREGATES_DIR, help="Directory of the aggregate tables.")
+    parser.add_argument('--chunksize', type=int, default=CHUNK_SIZE, help="Rows cleaned at a time.")
+    parser.add_argument('--year', type=int, default=DEFAULT_YEAR, help="Year of the new rows, when the raw file has none.")
+    args = parser.parse_args()
+
+    total_rows = ingest_sales(args.input, args.output, args.columnar, args.cube, args.chunksize, args.year,
+                              args.database, args.aggregates, args.rejects)
+    print(f"{total_rows} rows appended to {args.output}")
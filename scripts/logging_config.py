@@ -0,0 +1,150 @@
+import os
+import queue
+import atexit
+import logging
+import threading
+import multiprocessing
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+# Directory of the log files:
+LOG_DIR = os.environ.get('LOG_DIR', '../logging')
+
+# Level of every logger, and optional levels of specific modules ("selection=DEBUG,metrics=WARNING"):
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+
+# Size-based rotation of the log files:
+LOG_MAX_BYTES = int(os.environ.get('LOG_MAX_BYTES', 10 * 2 ** 20))
+LOG_BACKUP_COUNT = int(os.environ.get('LOG_BACKUP_COUNT', 5))
+
+# Log file of the modules that keep their own file, every other module logs to dashboard.log:
+LOG_FILES = {
+    'index': 'index.log',
+    'helper_functions': 'helper_functions.log',
+    'visualizations_functions': 'visualizations.log',
+}
+DEFAULT_LOG_FILE = 'dashboard.log'
+
+LOG_FORMAT = '%(asctime)s - %(process)d - %(name)s - %(levelname)s - %(message)s'
+
+# Handler of the root logger (only puts the records on a queue) and the threads writing them:
+_queue_handler = None
+_listeners = []
+# Queue through which forked processes (gunicorn workers, process pools) send their records:
+_fork_queue = None
+_setup_lock = threading.Lock()
+
+
+class RoutingFileHandler(logging.Handler):
+    """
+    Writes each record to the rotating log file of the module that emitted it (see LOG_FILES).
+    Files are opened on their first record.
+    """
+
+    def __init__(self, log_dir=LOG_DIR, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT):
+        super().__init__()
+        self.log_dir = log_dir
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._handlers = {}
+
+    def _handler(self, name):
+        file_name = LOG_FILES.get(name.split('.')[0], DEFAULT_LOG_FILE)
+        handler = self._handlers.get(file_name)
+        if handler is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            handler = RotatingFileHandler(os.path.join(self.log_dir, file_name), maxBytes=self.max_bytes,
+                                          backupCount=self.backup_count, encoding='utf-8', delay=True)
+            handler.setFormatter(self.formatter)
+            self._handlers[file_name] = handler
+        return handler
+
+    def emit(self, record):
+        try:
+            self._handler(record.name).handle(record)
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super().close()
+
+
+def _start_listener(records):
+    """
+    Starts a thread writing the records of a queue to the console and the log files.
+    """
+    handlers = _listeners[0].handlers if _listeners else _build_handlers()
+    listener = QueueListener(records, *handlers, respect_handler_level=True)
+    listener.start()
+    _listeners.append(listener)
+
+
+def _build_handlers():
+    formatter = logging.Formatter(LOG_FORMAT)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    files = RoutingFileHandler()
+    files.setFormatter(formatter)
+    return console, files
+
+
+def _before_fork():
+    # Runs in the parent: the first fork opens the queue the children will write to.
+    global _fork_queue
+
+    if _queue_handler is not None and _fork_queue is None and _listeners:
+        _fork_queue = multiprocessing.Queue()
+        _start_listener(_fork_queue)
+
+
+def _after_fork_in_child():
+    # The listener threads are not copied by fork: the child sends its records to the parent,
+    # which stays the only process writing (and rotating) the log files.
+    global _listeners
+
+    if _queue_handler is not None and _fork_queue is not None:
+        _queue_handler.queue = _fork_queue
+        _listeners = []
+
+
+def stop_logging():
+    """
+    Writes the records still queued and stops the listeners (called at exit).
+    """
+    while _listeners:
+        listener = _listeners.pop()
+        listener.stop()
+        if not _listeners:
+            for handler in listener.handlers:
+                handler.close()
+
+
+def setup_logging(level=LOG_LEVEL, levels=LOG_LEVELS):
+    """
+    Configures the logging of the whole process, once (later calls do nothing). Loggers only
+    put their records on a queue; a background thread formats and writes them to the console
+    and to size-rotated files, so logging never waits on I/O within a callback.
+    :param level: Level of every logger.
+    :param levels: Levels of specific modules, as "module=LEVEL,module=LEVEL".
+    """
+    global _queue_handler
+
+    with _setup_lock:
+        if _queue_handler is not None:
+            return
+
+        root = logging.getLogger()
+        root.setLevel(level.upper())
+        for item in filter(None, (item.strip() for item in levels.split(','))):
+            name, module_level = item.split('=')
+            logging.getLogger(name.strip()).setLevel(module_level.strip().upper())
+
+        records = queue.SimpleQueue()
+        _queue_handler = QueueHandler(records)
+        _start_listener(records)
+        root.addHandler(_queue_handler)
+
+        atexit.register(stop_logging)
+        os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
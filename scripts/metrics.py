@@ -0,0 +1,296 @@
+import os
+import glob
+import json
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+
+from figure_cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets:
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000, 1_000_000, 5_000_000)
+
+# Directory shared by the server workers (set by gunicorn.conf.py): every process saves its metrics
+# there and /metrics reports their sum. When not set, /metrics reports the process serving it only.
+# The files of the processes of a previous run are summed as well, so a given directory must be
+# emptied before the server starts:
+METRICS_DIR = os.environ.get('DASHBOARD_METRICS_DIR')
+
+# Seconds between two saves of the metrics of a process into METRICS_DIR (each one is saved after
+# the requests it serves, so /metrics may miss the last seconds of the other workers):
+METRICS_SAVE_INTERVAL = float(os.environ.get('DASHBOARD_METRICS_SAVE_INTERVAL', 5))
+
+
+class Histogram:
+    """
+    Prometheus-style histogram: cumulative bucket counters, sum and count per set of labels.
+    """
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def series(self):
+        """
+        Returns a copy of the counters of every set of labels.
+        """
+        with self._lock:
+            return {labels: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']}
+                    for labels, series in self._series.items()}
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self, series=None):
+        """
+        Renders the histogram in the Prometheus text format.
+        :param series: Counters to be rendered (see series), None for the ones of this process.
+        :return: List of lines.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, counters in sorted((self.series() if series is None else series).items()):
+            label_text = ','.join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            for bound, count in zip(self.buckets, counters['buckets']):
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {counters["count"]}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {counters["sum"]}')
+            lines.append(f'{self.name}_count{{{label_text}}} {counters["count"]}')
+        return lines
+
+
+# Time spent by each callback/chart builder in each phase
+# (callbacks: filter, total, serialization; charts: aggregate, figure_build, total):
+phase_seconds = Histogram('dashboard_phase_seconds', "Time spent in each phase of the callbacks and charts.",
+                          ('target', 'phase'), SECONDS_BUCKETS)
+# Size of the responses sent to the browser by each callback:
+response_bytes = Histogram('dashboard_response_bytes', "Size of the callback responses.",
+                           ('callback',), BYTES_BUCKETS)
+
+HISTOGRAMS = (phase_seconds, response_bytes)
+
+# Callback and chart builder running on the current thread (the filter and aggregation times
+# are attributed to them):
+_current = threading.local()
+
+
+@contextmanager
+def timed_filter():
+    """
+    Records the time spent within the block as the 'filter' phase of the running callback.
+    """
+    callback = getattr(_current, 'callback', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if callback is not None:
+            phase_seconds.observe((callback, 'filter'), time.perf_counter() - start)
+
+
+@contextmanager
+def timed_aggregation():
+    """
+    Records the time spent within the block as the 'aggregate' phase of the running chart builder.
+    """
+    chart = getattr(_current, 'chart', None)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        if chart is not None:
+            elapsed = time.perf_counter() - start
+            _current.aggregate_seconds += elapsed
+            phase_seconds.observe((chart, 'aggregate'), elapsed)
+
+
+def instrument_chart(func):
+    """
+    Times a chart builder of visualizations_functions. The figure build phase is the total
+    time minus the aggregation time recorded by timed_aggregation during the call.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _current.chart, _current.aggregate_seconds = func.__name__, 0.0
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            total = time.perf_counter() - start
+            phase_seconds.observe((func.__name__, 'total'), total)
+            phase_seconds.observe((func.__name__, 'figure_build'), total - _current.aggregate_seconds)
+            _current.chart = None
+
+    return wrapper
+
+
+def instrument_callback(func):
+    """
+    Times a Dash callback (placed right below @app.callback). The callback's name and time are
+    kept in the request context, so that the response size and the serialization time done by
+    Dash after the callback returns are recorded by the after_request hook.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _current.callback = func.__name__
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            _current.callback = None
+            phase_seconds.observe((func.__name__, 'total'), elapsed)
+            if has_request_context():
+                g.dash_callback, g.callback_seconds = func.__name__, elapsed
+
+    return wrapper
+
+
+def _before_request():
+    g.request_start = time.perf_counter()
+
+
+def _after_request(response):
+    callback = g.get('dash_callback')
+    if callback is not None and request.path.endswith('/_dash-update-component'):
+        # Everything Dash did besides running the callback is mostly the JSON encoding of the figures:
+        elapsed = time.perf_counter() - g.request_start
+        phase_seconds.observe((callback, 'serialization'), max(elapsed - g.callback_seconds, 0.0))
+        if response.content_length is not None:
+            response_bytes.observe((callback,), response.content_length)
+    save_metrics()
+    return response
+
+
+_last_save = 0.0
+
+
+def save_metrics(force=False):
+    """
+    Saves the metrics of this process into METRICS_DIR (as JSON, one file per process), at most
+    once every METRICS_SAVE_INTERVAL seconds unless forced. Does nothing when METRICS_DIR is not set.
+    :param force: Save even if the last save is recent.
+    """
+    global _last_save
+
+    now = time.monotonic()
+    if METRICS_DIR is None or (not force and now - _last_save < METRICS_SAVE_INTERVAL):
+        return
+    _last_save = now
+
+    try:
+        metrics = {'histograms': {histogram.name: [[list(labels), counters]
+                                                   for labels, counters in histogram.series().items()]
+                                  for histogram in HISTOGRAMS},
+                   'caches': {name: [cache.hits, cache.misses] for name, cache in caches.items()}}
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        path = os.path.join(METRICS_DIR, f"{os.getpid()}.json")
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(metrics, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logger.warning(f"Could not save the metrics of the process: {str(e)}")
+
+
+def _load_metrics():
+    # Sums the metrics saved by every process into METRICS_DIR (the ones of the workers that are gone
+    # included, so the counters never go down while the server runs):
+    histograms = {histogram.name: {} for histogram in HISTOGRAMS}
+    hits, misses = {}, {}
+    for path in glob.glob(os.path.join(METRICS_DIR, '*.json')):
+        try:
+            with open(path, encoding='utf-8') as f:
+                metrics = json.load(f)
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable metrics file {path}: {str(e)}")
+            continue
+
+        for name, series in metrics['histograms'].items():
+            for labels, counters in series:
+                total = histograms.setdefault(name, {}).setdefault(
+                    tuple(labels), {'buckets': [0] * len(counters['buckets']), 'sum': 0.0, 'count': 0})
+                total['buckets'] = [a + b for a, b in zip(total['buckets'], counters['buckets'])]
+                total['sum'] += counters['sum']
+                total['count'] += counters['count']
+        for name, (cache_hits, cache_misses) in metrics['caches'].items():
+            hits[name] = hits.get(name, 0) + cache_hits
+            misses[name] = misses.get(name, 0) + cache_misses
+
+    return histograms, hits, misses
+
+
+def reset_metrics():
+    """
+    Clears the metrics of this process, e.g. in a worker forked from a process which already
+    served some callbacks (they would be counted once per worker otherwise).
+    """
+    for histogram in HISTOGRAMS:
+        histogram.reset()
+    for cache in caches.values():
+        cache.hits = cache.misses = 0
+
+
+def render_metrics():
+    """
+    Renders every metric in the Prometheus text format: the sum over all the server's processes
+    when METRICS_DIR is set, otherwise the ones of this process.
+    :return: Text of the /metrics page.
+    """
+    if METRICS_DIR is not None:
+        save_metrics(force=True)
+        histograms, hits, misses = _load_metrics()
+    else:
+        histograms = {histogram.name: histogram.series() for histogram in HISTOGRAMS}
+        hits = {name: cache.hits for name, cache in caches.items()}
+        misses = {name: cache.misses for name, cache in caches.items()}
+
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines += histogram.render(histograms[histogram.name])
+
+    lines += ["# HELP dashboard_cache_hits_total Lookups answered by the cache.",
+              "# TYPE dashboard_cache_hits_total counter"]
+    lines += [f'dashboard_cache_hits_total{{cache="{name}"}} {count}' for name, count in sorted(hits.items())]
+    lines += ["# HELP dashboard_cache_misses_total Lookups not found in the cache.",
+              "# TYPE dashboard_cache_misses_total counter"]
+    lines += [f'dashboard_cache_misses_total{{cache="{name}"}} {count}' for name, count in sorted(misses.items())]
+
+    return '\n'.join(lines) + '\n'
+
+
+def init_metrics(server):
+    """
+    Installs the timing hooks and the /metrics route on the Flask server. With several worker
+    processes, /metrics reports the sum of the metrics of all of them when they share METRICS_DIR
+    (as set by gunicorn.conf.py), and only the ones of the worker answering it otherwise.
+    :param server: Flask instance of the Dash app.
+    """
+    server.before_request(_before_request)
+    server.after_request(_after_request)
+
+    @server.route('/metrics')
+    def metrics():
+        return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,98 @@
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Filters of the dashboard are given as {column: selected values}: a row is kept when its value
+# is one of the selected values of every filtered column (AND across columns, IN within a column).
+# A column without any selected value (None or an empty list) is not filtered.
+
+
+def _as_list(values):
+    return list(values) if isinstance(values, (list, tuple, set)) else [values]
+
+
+def predicates(filters):
+    """
+    Normalizes filters into predicates: the same selection always gives the same predicates,
+    whatever the order the values were clicked in, so they can key the shared selections.
+    :param filters: Dict of {column: selected value or list of values}.
+    :return: Tuple of (column, tuple of selected values), sorted by column.
+    """
+    return tuple(sorted((col, tuple(sorted(set(_as_list(values)))))
+                        for col, values in filters.items() if values is not None and _as_list(values)))
+
+
+def estimate_rows(df, predicate, index=None):
+    """
+    Estimates the number of rows matching a predicate. Indexed columns give the exact count (the
+    length of their posting lists); dictionary-encoded columns assume evenly spread categories;
+    any other column is assumed to match every row.
+    :param df: Dataframe to be filtered.
+    :param predicate: (column, values).
+    :param index: Filter index of the dataframe (see filter_index.build_filter_index), if any.
+    :return: Estimated number of matching rows.
+    """
+    col, values = predicate
+    if index is not None and col in index:
+        return sum(len(index[col].get(value, ())) for value in values)
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+        return len(df) * len(values) / max(len(df[col].cat.categories), 1)
+    return len(df)
+
+
+def plan(df, preds, index=None):
+    """
+    Orders the predicates from the most to the least selective, so each step works on the fewest
+    rows. Predicates of indexed columns come first: they are resolved from the posting lists
+    without reading the column.
+    :param df: Dataframe to be filtered.
+    :param preds: Predicates returned by predicates().
+    :param index: Filter index of the dataframe, if any.
+    :return: List of predicates, in the order they must be applied.
+    """
+    return sorted(preds, key=lambda p: (index is None or p[0] not in index, estimate_rows(df, p, index)))
+
+
+def query_positions(df, preds, index=None, block=None):
+    """
+    Finds the rows matching every predicate. Indexed predicates intersect the union of the
+    posting lists of their values; the other ones are evaluated only on the rows left by the
+    previous steps, instead of building a mask over the whole dataframe for each of them.
+    :param df: Dataframe to be filtered.
+    :param preds: Predicates returned by predicates().
+    :param index: Filter index of the dataframe, if any.
+    :param block: (first, last) range of positions the rows must also fall in (e.g. a date range of
+                  the cube, sorted by date), None for every row.
+    :return: Sorted array of row positions, or None when nothing is filtered.
+    """
+    try:
+        first, last = block if block is not None else (0, len(df))
+        positions = None
+
+        for col, values in plan(df, preds, index):
+            if positions is not None and not len(positions):
+                # Nothing left, the remaining predicates would not change the result:
+                break
+
+            if index is not None and col in index:
+                postings = [index[col].get(value, np.empty(0, dtype=np.intp)) for value in values]
+                # The posting lists of different values never share a row:
+                posting = postings[0] if len(postings) == 1 else np.sort(np.concatenate(postings))
+                posting = posting[np.searchsorted(posting, first):np.searchsorted(posting, last)]
+                positions = posting if positions is None else np.intersect1d(positions, posting, assume_unique=True)
+            else:
+                if positions is None:
+                    positions = np.arange(first, last)
+                matches = df[col].iloc[positions].isin(values).to_numpy()
+                positions = positions[matches]
+
+        if positions is None and (first, last) != (0, len(df)):
+            positions = np.arange(first, last)
+
+        return positions
+
+    except Exception as e:
+        logger.error(f"Error while querying the rows matching {preds}: {str(e)}")
+        raise
@@ -0,0 +1,151 @@
+import logging
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+from data_loader import DATE_COLUMN
+from query import query_positions
+from sales_cube import CUBE_MEASURES
+
+logger = logging.getLogger(__name__)
+
+# Groups of the prefix sums: every dimension of the cube other than the date (and the month and
+# day derived from it). The charts and KPIs built from totals (rankings, bars, pies, indicators)
+# roll up to a subset of them, and every filter of the dashboard other than the months (served
+# as date intervals) selects some of the groups.
+RANGE_GROUPS = ('Equipe', 'Consultor', 'Meio de Propaganda', 'Status de Pagamento')
+
+# Column whose selected values are turned into date intervals:
+MONTH_COLUMN = 'Mês'
+
+# Running totals of one group set, kept only for the (group, day) pairs with sales, so memory grows
+# with the cells of the cube and not with the number of groups times the number of days. The pairs
+# are sorted by `keys` (group code * `n_days` + day, counted from `first_day`), and `sums[measure][i]`
+# is the total of the first i pairs: the total of group g over days [a, b] is sums[measure][j] -
+# sums[measure][i], where i and j are the bounds of the keys from g * n_days + a to g * n_days + b
+# (two binary searches), and j - i counts the cells of the group within the range.
+PrefixSums = namedtuple('PrefixSums', ['groups', 'first_day', 'n_days', 'keys', 'sums'])
+
+
+def _day(value):
+    """
+    Converts a date (string, Timestamp or datetime64) into a numpy day.
+    """
+    return pd.Timestamp(value).to_datetime64().astype('datetime64[D]')
+
+
+def build_prefix_sums(cube, keys, measures=CUBE_MEASURES):
+    """
+    Builds the day-by-day running totals of every group of the cube, over the days with sales only.
+    Memory is three integers (key and running total of each measure) per cell of the cube.
+    :param cube: Cube returned by build_sales_cube.
+    :param keys: Dimensions identifying a group (e.g. ('Consultor', 'Equipe')).
+    :param measures: Additive columns to be summed.
+    :return: PrefixSums.
+    """
+    try:
+        days = cube[DATE_COLUMN].to_numpy().astype('datetime64[D]')
+        first_day = days.min()
+        day = (days - first_day).astype(np.int64)
+        n_days = int(day.max()) + 1
+
+        grouped = cube.groupby(list(keys), observed=True, sort=True)
+        codes, groups = grouped.ngroup().to_numpy(), grouped.size().index
+        cell_keys = codes * n_days + day
+        order = np.argsort(cell_keys, kind='stable')
+
+        sums = {measure: np.concatenate([[0], np.cumsum(cube[measure].to_numpy()[order], dtype=np.int64)])
+                for measure in measures}
+
+        logger.info(f"Prefix sums of {', '.join(keys)} built: {len(groups)} groups, "
+                    f"{len(order)} cells over {n_days} days")
+
+        return PrefixSums(groups=groups.to_frame(index=False), first_day=first_day, n_days=n_days,
+                          keys=cell_keys[order], sums=sums)
+
+    except Exception as e:
+        logger.error(f"Error while building the prefix sums of {keys}: {str(e)}")
+        raise
+
+
+def build_range_totals(cube, groups=RANGE_GROUPS):
+    """
+    Builds the prefix sums served by range_totals.
+    :param cube: Cube returned by build_sales_cube.
+    :param groups: Dimensions identifying a group.
+    :return: PrefixSums.
+    """
+    return build_prefix_sums(cube, groups)
+
+
+def date_intervals(start, end, months=()):
+    """
+    Splits a date range into the intervals of the selected months: one interval per month and
+    year within the range, clipped to it.
+    :param start: First day of the range (numpy day).
+    :param end: Last day of the range, included (numpy day).
+    :param months: Months selected by user (none keeps the whole range).
+    :return: List of (first day, last day) intervals, last day included.
+    """
+    if not months:
+        return [(start, end)] if start <= end else []
+
+    intervals = []
+    for year in range(start.astype('datetime64[Y]').astype(int), end.astype('datetime64[Y]').astype(int) + 1):
+        for month in sorted(months):
+            first_month_day = (np.datetime64(year, 'Y') + np.timedelta64(month - 1, 'M')).astype('datetime64[D]')
+            last_month_day = (first_month_day.astype('datetime64[M]') + 1).astype('datetime64[D]') - 1
+            first, last = max(start, first_month_day), min(end, last_month_day)
+            if first <= last:
+                intervals.append((first, last))
+    return intervals
+
+
+def range_totals(prefix_sums, keys, value, preds=(), start=None, end=None):
+    """
+    Totals by group over a date range, read from the prefix sums: each interval costs two
+    binary searches per group, instead of a scan of the cells within the range. The groups
+    are filtered first and only the ones left are rolled up to the requested dimensions.
+    :param prefix_sums: PrefixSums returned by build_range_totals.
+    :param keys: Dimensions to keep, a subset of the groups of the prefix sums.
+    :param value: Measure to be summed.
+    :param preds: Predicates of the filters (see query.predicates), on the month or on the groups.
+    :param start: First date selected by user (None for the first date of the dataset).
+    :param end: Last date selected by user, included (None for the last date of the dataset).
+    :return: Dataframe with the kept dimensions and the total of the measure, with one row per
+             combination with sales within the selection (the same rows as rolling up a slice of the cube).
+    """
+    try:
+        sums, n_days = prefix_sums.sums[value], prefix_sums.n_days
+        last_day = prefix_sums.first_day + n_days - 1
+
+        start = prefix_sums.first_day if start is None else max(_day(start), prefix_sums.first_day)
+        end = last_day if end is None else min(_day(end), last_day)
+
+        months = dict(preds).get(MONTH_COLUMN, ())
+        group_preds = [pred for pred in preds if pred[0] != MONTH_COLUMN]
+
+        # Filter the groups (far fewer rows than the cube) before reading their sums:
+        selected = query_positions(prefix_sums.groups, group_preds)
+        if selected is None:
+            selected = np.arange(len(prefix_sums.groups))
+
+        intervals = date_intervals(start, end, months)
+        first = np.array([(a - prefix_sums.first_day).astype(int) for a, _ in intervals], dtype=np.int64)
+        last = np.array([(b - prefix_sums.first_day).astype(int) for _, b in intervals], dtype=np.int64)
+
+        # Bounds of the cells of each selected group within each interval (one row per group):
+        group_keys = selected.astype(np.int64)[:, None] * n_days
+        lower = np.searchsorted(prefix_sums.keys, group_keys + first, 'left')
+        upper = np.searchsorted(prefix_sums.keys, group_keys + last, 'right')
+
+        totals = (sums[upper] - sums[lower]).sum(axis=1)
+        with_sales = (upper - lower).sum(axis=1) > 0
+
+        df = prefix_sums.groups.iloc[selected[with_sales]].reset_index(drop=True)
+        df[value] = totals[with_sales]
+        return df.groupby(list(keys), observed=True)[value].sum().reset_index()
+
+    except Exception as e:
+        logger.error(f"Error while reading the range totals of {value}: {str(e)}")
+        raise
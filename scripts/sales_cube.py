@@ -0,0 +1,208 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+
+from data_loader import CLEAN_DATASET, DATE_COLUMN, is_up_to_date
+from metrics import timed_aggregation
+from filter_index import build_filter_index, take_rows
+from query import predicates, query_positions
+
+logger = logging.getLogger(__name__)
+
+# Dimensions kept by the cube (every filter and chart of the dashboard groups by a subset of them).
+# The date comes first, so the cells are sorted by date and any date range is a contiguous block:
+CUBE_DIMENSIONS = [DATE_COLUMN, 'Mês', 'Dia', 'Equipe', 'Consultor', 'Meio de Propaganda', 'Status de Pagamento']
+
+# Dimensions filtered by the dashboard, indexed by posting lists:
+CUBE_FILTERS = ['Mês', 'Equipe', 'Meio de Propaganda', 'Status de Pagamento']
+
+# Additive measures pre-aggregated by the cube:
+CUBE_MEASURES = ['Valor Pago', 'Chamadas Realizadas']
+
+# Cube maintained on disk by data_preprocessing.py and ingest_sales.py:
+CUBE_DATASET = "../datasets/sales_cube.csv"
+
+# Cells of the block cubes kept by a run before they are merged (see add_sales_cube):
+CUBE_MERGE_CELLS = int(os.environ.get('CUBE_MERGE_CELLS', 2_000_000))
+
+
+def build_sales_cube(df, dimensions=CUBE_DIMENSIONS, measures=CUBE_MEASURES):
+    """
+    Pre-aggregates the cleaned sales dataset over the dashboard's dimensions.
+    Every chart only sums the measures, so grouping the cube again yields the same
+    totals as grouping the raw rows, while its size depends only on the number of
+    distinct dimension combinations.
+    :param df: Cleaned sales dataframe (sales_analysis.csv).
+    :param dimensions: Columns to keep as the cube's dimensions.
+    :param measures: Additive columns to be summed.
+    :return: Dataframe with one row per combination of dimensions.
+    """
+    try:
+        cube = df.groupby(dimensions, observed=True)[measures].sum().reset_index()
+
+        logger.info(f"Sales cube built: {len(df)} rows reduced to {len(cube)} cells")
+
+        return cube
+
+    except Exception as e:
+        logger.error(f"Error while building the sales cube: {str(e)}")
+        raise
+
+
+def merge_sales_cubes(cubes):
+    """
+    Merges the cubes of disjoint blocks of rows (such as the chunks of a file) into a single
+    cube. The cells are grouped once for all the blocks, instead of once per block.
+    :param cubes: List of cubes returned by build_sales_cube.
+    :return: Merged cube (without any cell when the list is empty).
+    """
+    try:
+        if not cubes:
+            return pd.DataFrame(columns=CUBE_DIMENSIONS + CUBE_MEASURES)
+
+        return build_sales_cube(pd.concat(cubes, ignore_index=True))
+
+    except Exception as e:
+        logger.error(f"Error while merging the sales cubes: {str(e)}")
+        raise
+
+
+def add_sales_cube(cubes, cube, max_cells=CUBE_MERGE_CELLS):
+    """
+    Adds the cube of a block of rows to the ones kept by a run, to be merged at the end by
+    merge_sales_cubes. When the blocks share few cells (many teams, consultants and days), the
+    kept cubes are merged as soon as the cells added since the last merge pass `max_cells` or the
+    size of the merged cube, so the memory of the run stays bounded by the size of the final cube
+    while each cell is still merged only a few times.
+    :param cubes: List of the cubes kept by the run, updated in place (the first one holds the
+                  cells merged so far).
+    :param cube: Cube of the new block of rows.
+    :param max_cells: Cells added before the first merge.
+    :return: The updated list.
+    """
+    cubes.append(cube)
+    if sum(len(added) for added in cubes[1:]) > max(max_cells, len(cubes[0])):
+        cubes[:] = [merge_sales_cubes(cubes)]
+    return cubes
+
+
+def write_sales_cube(cube, path=CUBE_DATASET):
+    """
+    Saves the cube, replacing the previous file atomically.
+    :param cube: Cube to be saved.
+    :param path: Path of the cube file.
+    """
+    tmp_path = path + ".tmp"
+    cube.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def append_sales_cube(cube, path=CUBE_DATASET):
+    """
+    Appends the cells of a delta (see merge_sales_cubes) at the end of the cube file, without
+    reading nor rewriting the cells already stored: their keys may repeat existing ones, and
+    read_sales_cube merges them.
+    :param cube: Cube of the new rows.
+    :param path: Path of the cube file.
+    """
+    cube.to_csv(path, index=False, mode='a', header=False)
+
+
+def read_sales_cube(path=CUBE_DATASET):
+    """
+    Reads the cube saved by write_sales_cube, merging the cells appended by append_sales_cube
+    since then into the existing ones.
+    :param path: Path of the cube file.
+    :return: Sales cube.
+    """
+    cube = pd.read_csv(path, parse_dates=[DATE_COLUMN])
+    if list(cube.columns) != CUBE_DIMENSIONS + CUBE_MEASURES:
+        return cube
+    if cube.duplicated(CUBE_DIMENSIONS).any() or not cube[DATE_COLUMN].is_monotonic_increasing:
+        cube = build_sales_cube(cube)
+    return cube
+
+
+def load_sales_cube(df, path=CUBE_DATASET, csv_path=CLEAN_DATASET):
+    """
+    Loads the cube maintained on disk when it is up to date with the cleaned dataset,
+    otherwise builds it from the dataframe.
+    :param df: Cleaned sales dataframe.
+    :param path: Path of the cube file.
+    :param csv_path: Path of the cleaned dataset.
+    :return: Sales cube.
+    """
+    try:
+        if is_up_to_date(path, csv_path):
+            cube = read_sales_cube(path)
+            if list(cube.columns) == CUBE_DIMENSIONS + CUBE_MEASURES:
+                return cube
+            logger.warning(f"Sales cube {path} has other dimensions, building it again")
+
+        return build_sales_cube(df)
+
+    except Exception as e:
+        logger.error(f"Error while loading the sales cube: {str(e)}")
+        raise
+
+
+def build_cube_index(cube):
+    """
+    Builds the posting lists of the cube for the filters of the dashboard.
+    :param cube: Cube returned by build_sales_cube.
+    :return: Filter index to be passed to slice_cube.
+    """
+    return build_filter_index(cube, CUBE_FILTERS)
+
+
+def date_block(cube, start=None, end=None):
+    """
+    Finds the cells of the cube within a date range. The cube is sorted by date, so they
+    form a single block found by two binary searches.
+    :param cube: Cube returned by build_sales_cube.
+    :param start: First date of the range (None for the first date of the cube).
+    :param end: Last date of the range, included (None for the last date of the cube).
+    :return: (first position, position after the last) of the block.
+    """
+    dates = cube[DATE_COLUMN].to_numpy()
+    first = 0 if start is None else int(np.searchsorted(dates, pd.Timestamp(start).to_datetime64(), 'left'))
+    last = len(dates) if end is None else int(np.searchsorted(dates, pd.Timestamp(end).to_datetime64(), 'right'))
+    return first, max(first, last)
+
+
+def slice_cube(cube, filters=None, index=None, start=None, end=None):
+    """
+    Selects the cells of the cube matching the filters and the date range chosen within the dashboard.
+    :param cube: Cube returned by build_sales_cube.
+    :param filters: Dict of {column: selected values} (see query.predicates), None keeps every cell.
+    :param index: Filter index of the cube (see build_cube_index). When given, the indexed filters
+                  are resolved from the precomputed row positions instead of reading the columns.
+    :param start: First date selected by user (None keeps every date before the end).
+    :param end: Last date selected by user, included (None keeps every date after the start).
+    :return: Slice of the cube.
+    """
+    try:
+        block = None if start is None and end is None else date_block(cube, start, end)
+        return take_rows(cube, query_positions(cube, predicates(filters or {}), index, block))
+
+    except Exception as e:
+        logger.error(f"Error while slicing the sales cube: {str(e)}")
+        raise
+
+
+def rollup_cube(cube_slice, cols_to_group, value):
+    """
+    Rolls a cube slice up to the dimensions used by a chart.
+    :param cube_slice: Slice of the cube returned by slice_cube.
+    :param cols_to_group: Dimension (or list of dimensions) to keep.
+    :param value: Measure to be summed.
+    :return: Series with the totals indexed by the kept dimensions.
+    """
+    try:
+        with timed_aggregation():
+            return cube_slice.groupby(cols_to_group, observed=True)[value].sum()
+
+    except Exception as e:
+        logger.error(f"Error while rolling up the sales cube: {str(e)}")
+        raise
@@ -0,0 +1,102 @@
+import os
+import logging
+import threading
+from concurrent.futures import Future
+
+from figure_cache import LRUCache, caches
+from metrics import timed_filter
+from query import predicates
+from top_k import rank_by_group
+
+logger = logging.getLogger(__name__)
+
+# Number of results (totals, rankings) of selections kept in memory by each process:
+SELECTION_CACHE_SIZE = int(os.environ.get('SELECTION_CACHE_SIZE', 128))
+
+_MISSING = object()
+
+# Results already computed, and the ones being computed right now:
+_selections = caches['selection'] = LRUCache(SELECTION_CACHE_SIZE)
+_in_flight = {}
+_in_flight_lock = threading.Lock()
+
+
+def _shared(key, compute):
+    """
+    Returns the result stored under `key`, computing it only once: the first caller runs
+    `compute` and the concurrent callers asking for the same key wait for its result.
+    """
+    result = _selections.get(key, _MISSING)
+    if result is not _MISSING:
+        return result
+
+    with _in_flight_lock:
+        # Check again, the owner may have finished while we were waiting for the lock:
+        result = _selections.get(key, _MISSING)
+        if result is not _MISSING:
+            return result
+        future = _in_flight.get(key)
+        owner = future is None
+        if owner:
+            future = _in_flight[key] = Future()
+
+    if not owner:
+        # Another callback is already computing this result:
+        return future.result()
+
+    try:
+        result = compute()
+        _selections.put(key, result)
+        future.set_result(result)
+        return result
+
+    except Exception as e:
+        logger.error(f"Error while computing the selection {key}: {str(e)}")
+        future.set_exception(e)
+        raise
+
+    finally:
+        with _in_flight_lock:
+            del _in_flight[key]
+
+
+def select_totals(store, version, keys, value, filters=None, start=None, end=None):
+    """
+    Returns the totals by some dimensions (e.g. teams) for a selection (filters and date range),
+    computing them only once per selection and dataset version. All the callbacks fired by the
+    same click share the totals: the first one asks the store and the concurrent ones wait for
+    that result instead of querying it again.
+    The returned dataframe is shared, so it must not be modified by the callers.
+    :param store: Data-access store of the snapshot (see data_access.open_store).
+    :param version: Version of the dataset the store was loaded from.
+    :param keys: Dimensions to keep.
+    :param value: Measure to be summed.
+    :param filters: Dict of {column: selected values} (see query.predicates), None keeps every row.
+    :param start: First date selected by user (None for the first date of the dataset).
+    :param end: Last date selected by user, included (None for the last date of the dataset).
+    :return: Dataframe with the kept dimensions and the total of the measure.
+    """
+    preds = predicates(filters or {})
+    with timed_filter():
+        return _shared(('totals', tuple(keys), value, preds, start, end, version),
+                       lambda: store.totals(keys, value, preds, start=start, end=end))
+
+
+def select_ranking(store, version, cols_to_group, value, filters=None, start=None, end=None):
+    """
+    Returns the ranking of members within groups (e.g. consultants within teams) for a
+    selection, computed once and shared by the charts and KPIs built from it.
+    :param store: Data-access store of the snapshot (see data_access.open_store).
+    :param version: Version of the dataset the store was loaded from.
+    :param cols_to_group: [member column, group column].
+    :param value: Measure to be summed.
+    :param filters: Dict of {column: selected values} (see query.predicates), None keeps every row.
+    :param start: First date selected by user (None for the first date of the dataset).
+    :param end: Last date selected by user, included (None for the last date of the dataset).
+    :return: GroupRanking (see top_k.rank_by_group).
+    """
+    preds = predicates(filters or {})
+    return _shared(('ranking', tuple(cols_to_group), value, preds, start, end, version),
+                   lambda: rank_by_group(select_totals(store, version, cols_to_group, value,
+                                                       dict(preds), start=start, end=end),
+                                         cols_to_group, value))
@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+import threading
+from collections import namedtuple
+
+from data_access import dataset_path, open_store
+from data_loader import dataset_version
+from figure_cache import caches, disk_cache
+
+logger = logging.getLogger(__name__)
+
+# Seconds between two checks of the dataset (cleaned CSV or database) by the reloader:
+RELOAD_INTERVAL = float(os.environ.get('DATASET_RELOAD_INTERVAL', 10))
+
+# Seconds the dataset must stay unchanged before being reloaded, so files still being
+# written (e.g. by ingest_sales.py, chunk by chunk) are not picked up half-way:
+RELOAD_SETTLE = float(os.environ.get('DATASET_RELOAD_SETTLE', 2))
+
+# Everything the callbacks read from one version of the dataset (the data-access store of the
+# configured backend, see data_access). Snapshots are never modified: a new version of the
+# dataset is published as a new snapshot.
+Snapshot = namedtuple('Snapshot', ['version', 'store'])
+
+_snapshot = None
+_publish_lock = threading.Lock()
+
+
+def build_snapshot(path=None):
+    """
+    Opens the store of the configured backend served by the callbacks.
+    :param path: Path of the dataset of the backend (see data_access.dataset_path), None for the default.
+    :return: Snapshot.
+    """
+    try:
+        path = path or dataset_path()
+        version = dataset_version(path)
+        store = open_store(path)
+
+        return Snapshot(version=version, store=store)
+
+    except Exception as e:
+        logger.error(f"Error while building the snapshot of the dataset: {str(e)}")
+        raise
+
+
+def publish(snapshot):
+    """
+    Makes a snapshot the one served to the new callbacks. The callbacks already running keep
+    the snapshot they started with. Cached results of older versions are dropped, from memory
+    and from the disk tier: they are keyed by version, so they would never be served again anyway.
+    :param snapshot: Snapshot to be served.
+    """
+    global _snapshot
+
+    with _publish_lock:
+        previous, _snapshot = _snapshot, snapshot
+
+    if previous is not None and previous.version != snapshot.version:
+        for cache in caches.values():
+            cache.clear()
+        if disk_cache is not None:
+            disk_cache.drop_versions(snapshot.version)
+        logger.info(f"Dataset version {snapshot.version} published (was {previous.version})")
+
+
+def current_snapshot():
+    """
+    Returns the snapshot being served, loading it on the first call. Callbacks must call it once
+    and use the returned snapshot for all their work, so a reload never mixes two versions.
+    :return: Snapshot.
+    """
+    global _snapshot
+
+    if _snapshot is None:
+        with _publish_lock:
+            if _snapshot is None:
+                _snapshot = build_snapshot()
+    return _snapshot
+
+
+def reload_if_changed(path=None, settle=RELOAD_SETTLE):
+    """
+    Builds and publishes a new snapshot when the dataset changed since the one served.
+    :param path: Path of the dataset of the backend, None for the default.
+    :param settle: Seconds the file must stay unchanged before being reloaded.
+    :return: True when a new snapshot was published.
+    """
+    path = path or dataset_path()
+    version = dataset_version(path)
+    if version == current_snapshot().version:
+        return False
+    if time.time() - os.path.getmtime(path) < settle:
+        return False
+
+    snapshot = build_snapshot(path)
+    # The file changed again while it was being loaded: try again on the next check.
+    if dataset_version(path) != snapshot.version:
+        return False
+
+    publish(snapshot)
+    return True
+
+
+def _reload_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            reload_if_changed(path)
+        except Exception as e:
+            # Keep serving the current snapshot, the next check will try again:
+            logger.warning(f"Dataset reload failed, still serving the previous version: {str(e)}")
+
+
+def start_reloader(path=None, interval=RELOAD_INTERVAL):
+    """
+    Starts the background thread checking the dataset for changes. Each server process
+    runs its own (threads do not survive a fork, so workers must start it after being forked).
+    :param path: Path of the dataset of the backend, None for the default.
+    :param interval: Seconds between two checks (0 disables the reloader).
+    :return: The started thread, or None.
+    """
+    if interval <= 0:
+        return None
+
+    path = path or dataset_path()
+    thread = threading.Thread(target=_reload_loop, args=(path, interval), name='dataset-reloader', daemon=True)
+    thread.start()
+    logger.info(f"Dataset reloader started, checking {path} every {interval}s")
+    return thread
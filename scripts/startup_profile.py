@@ -0,0 +1,69 @@
+import os
+import sys
+import argparse
+import subprocess
+
+# Reports where the startup of the dashboard goes:
+#     python startup_profile.py [--module index] [--top 20]
+# The import is profiled with `python -X importtime` in a fresh interpreter, so nothing
+# imported by this script affects the numbers.
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Code run by the profiled interpreter: import the module, then wait for its background startup.
+PROBE = """
+import time
+start = time.perf_counter()
+import {module} as target
+imported = time.perf_counter() - start
+getattr(target, 'wait_until_ready', lambda: None)()
+print(f"{{imported}} {{time.perf_counter() - start}}")
+"""
+
+
+def parse_importtime(stderr):
+    """
+    Parses the report written by `python -X importtime`.
+    :param stderr: Text written by the interpreter on stderr.
+    :return: List of (module, self microseconds, cumulative microseconds, depth).
+    """
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def profile_startup(module='index'):
+    """
+    Imports a module in a fresh interpreter with the import-time profiler on.
+    :param module: Module to be profiled.
+    :return: (seconds to import, seconds until ready, list of imported modules).
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module)],
+                            cwd=SCRIPTS_DIR, capture_output=True, text=True, check=True)
+    imported, ready = map(float, result.stdout.split()[-2:])
+    return imported, ready, parse_importtime(result.stderr)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Profile the import time and startup of the dashboard.")
+    parser.add_argument('--module', default='index', help="Module to be profiled.")
+    parser.add_argument('--top', type=int, default=20, help="Number of modules listed.")
+    args = parser.parse_args()
+
+    imported, ready, modules = profile_startup(args.module)
+
+    print(f"Import of {args.module}: {imported:.3f}s, ready (dataset loaded, layout built): {ready:.3f}s\n")
+
+    print(f"Top {args.top} imports of {args.module} by cumulative time:")
+    top_level = sorted((m for m in modules if m[3] == 1), key=lambda m: m[2], reverse=True)
+    for name, _, cumulative_us, _ in top_level[:args.top]:
+        print(f"  {cumulative_us / 1e3:9.1f} ms  {name}")
+
+    print(f"\nTop {args.top} modules by self time:")
+    for name, self_us, _, _ in sorted(modules, key=lambda m: m[1], reverse=True)[:args.top]:
+        print(f"  {self_us / 1e3:9.1f} ms  {name}")
@@ -0,0 +1,78 @@
+import logging
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+
+from sales_cube import rollup_cube
+
+logger = logging.getLogger(__name__)
+
+# Totals of every member (e.g. consultant) and the top members of each group (e.g. team):
+GroupRanking = namedtuple('GroupRanking', ['totals', 'top_per_group'])
+
+
+def top_k(totals, k=1):
+    """
+    Selects the k largest totals without sorting all of them: argmax for k=1,
+    partial selection (argpartition) otherwise. Only the k selected values are sorted.
+    :param totals: Series of totals.
+    :param k: Number of entries to keep.
+    :return: Series with the k largest totals, in descending order.
+    """
+    try:
+        values = totals.to_numpy()
+        if k == 1:
+            positions = [int(np.argmax(values))] if len(values) else []
+        elif k < len(values):
+            positions = np.argpartition(-values, k - 1)[:k]
+        else:
+            positions = np.arange(len(values))
+
+        return totals.iloc[positions].sort_values(ascending=False)
+
+    except Exception as e:
+        logger.error(f"Error while selecting the top {k} totals: {str(e)}")
+        raise
+
+
+def top_k_per_group(totals, group_level, k=1):
+    """
+    Selects the k largest totals within each group, in a single pass over the totals
+    (argmax per group for k=1, nlargest per group otherwise).
+    :param totals: Series of totals indexed by (member, group).
+    :param group_level: Name of the index level holding the groups.
+    :param k: Number of entries kept per group.
+    :return: Series with the top totals of every group, in descending order.
+    """
+    try:
+        if totals.empty:
+            return totals
+
+        # Work on positions and on the integer codes of the groups, so the selection never
+        # has to look up the (member, group) labels:
+        codes = totals.index.codes[totals.index.names.index(group_level)]
+        grouped = pd.Series(totals.to_numpy()).groupby(codes, sort=False)
+        if k == 1:
+            positions = grouped.idxmax().to_numpy()
+        else:
+            positions = grouped.nlargest(k).index.get_level_values(1).to_numpy()
+
+        return totals.iloc[positions].sort_values(ascending=False)
+
+    except Exception as e:
+        logger.error(f"Error while selecting the top {k} totals per group: {str(e)}")
+        raise
+
+
+def rank_by_group(df, cols_to_group, value, k=1):
+    """
+    Computes the totals of the members and their top k within each group, shared by the
+    consultant charts and KPIs of a selection.
+    :param df: Slice of the sales cube.
+    :param cols_to_group: [member column, group column], e.g. ['Consultor', 'Equipe'].
+    :param value: Measure to be summed.
+    :param k: Number of members kept per group.
+    :return: GroupRanking.
+    """
+    totals = rollup_cube(df, cols_to_group, value)
+    return GroupRanking(totals=totals, top_per_group=top_k_per_group(totals, cols_to_group[1], k))
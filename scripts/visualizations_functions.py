@@ -1,54 +1,41 @@
-import pandas as pd
 import plotly.graph_objects as go
 import plotly.express as px
 import logging
 
-def setup_logger(log_file):
-    """Set up a logger to log events to both console and a file."""
-    logger = logging.getLogger(__name__)
-    logger.setLevel(logging.DEBUG)
+from downsampling import LTTB, MIN_MAX, downsample
+from metrics import instrument_chart
+from sales_cube import rollup_cube
+from top_k import rank_by_group, top_k
 
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
+logger = logging.getLogger(__name__)
 
-    # Log to console
-    ch = logging.StreamHandler()
-    ch.setLevel(logging.DEBUG)
-
-    ch.setFormatter(formatter)
-    logger.addHandler(ch)
-
-    # Log to file
-    fh = logging.FileHandler(log_file)
-    fh.setLevel(logging.DEBUG)
-    fh.setFormatter(formatter)
-    logger.addHandler(fh)
-
-    return logger
-
-# Configure the logger:
-logger = setup_logger('../logging/visualizations.log')
+# Title of the indicators when the selected dates have no sales:
+NO_SALES_TITLE = "<span>Sem vendas no período</span>"
 
 
 # ======================= TOP CONSULTANT BY EACH TEAM AND SALES (PIE CHART) ==========================
 
-def pie_consultant_by_team(df, cols_to_group, value):
+@instrument_chart
+def pie_consultant_by_team(df, cols_to_group, value, ranking=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param ranking: GroupRanking already computed for the selection (see top_k.rank_by_group).
     :return:
     """
     try:
         # Define the dataframe:
-        top_consult_team_sales = df.groupby(cols_to_group)[value].sum().\
-            sort_values(ascending=False).groupby(cols_to_group[1]).head(1).reset_index()
+        ranking = ranking or rank_by_group(df, cols_to_group, value)
+        top_consult_team_sales = ranking.top_per_group.reset_index()
 
         # Construct the visualization:
         fig1 = go.Figure()
         fig1.add_trace(
             go.Pie(
-                labels = top_consult_team_sales[cols_to_group[0]] + " (" + top_consult_team_sales[cols_to_group[1]] + ")",
+                labels = top_consult_team_sales[cols_to_group[0]].astype(str) + " (" +
+                         top_consult_team_sales[cols_to_group[1]].astype(str) + ")",
                 values = top_consult_team_sales[value],
                 hole = 0.5
             )
@@ -63,18 +50,20 @@ def pie_consultant_by_team(df, cols_to_group, value):
 
 # ======================= TOP CONSULTANT BY EACH TEAM AND SALES (BAR CHART) =============================
 
-def bar_consultant_by_team(df, cols_to_group, value):
+@instrument_chart
+def bar_consultant_by_team(df, cols_to_group, value, ranking=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param ranking: GroupRanking already computed for the selection (see top_k.rank_by_group).
     :return:
     """
     try:
         # Define the dataframe:
-        top_consult_team_sales = df.groupby(cols_to_group)[value].sum(). \
-            sort_values(ascending=False).groupby(cols_to_group[1]).head(1).reset_index()
+        ranking = ranking or rank_by_group(df, cols_to_group, value)
+        top_consult_team_sales = ranking.top_per_group.reset_index()
 
         # Construct the visualization:
         fig2 = go.Figure()
@@ -100,23 +89,27 @@ def bar_consultant_by_team(df, cols_to_group, value):
 
 # ================================= TOTAL CALLS BY DAY OF MONTH =======================================
 
-def scatter_calls_by_day(df, cols_to_group, value):
+@instrument_chart
+def scatter_calls_by_day(df, cols_to_group, value, max_points=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param max_points: Maximum number of points drawn (min/max downsampling), None draws them all.
     :return:
     """
     try:
         # Create auxiliary dataframe:
-        calls_by_day = df.groupby(cols_to_group)[value].sum().reset_index()
+        calls_by_day = rollup_cube(df, cols_to_group, value).reset_index()
+        # Keep the peaks and valleys of the area within the point budget:
+        points = downsample(calls_by_day, cols_to_group, value, max_points, method=MIN_MAX)
 
         # Build the chart:
         fig3 = go.Figure(
             go.Scatter(
-                x = calls_by_day[cols_to_group],
-                y = calls_by_day[value],
+                x = points[cols_to_group],
+                y = points[value],
                 mode = 'lines',
                 fill = 'tonexty'
             )
@@ -147,23 +140,27 @@ def scatter_calls_by_day(df, cols_to_group, value):
 
 # ===================== TOTAL CALLS BY MONTH ===========================
 
-def scatter_calls_by_month(df, cols_to_group, value):
+@instrument_chart
+def scatter_calls_by_month(df, cols_to_group, value, max_points=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param max_points: Maximum number of points drawn (min/max downsampling), None draws them all.
     :return:
     """
     try:
         # Create dataframe to be used by visualization:
-        calls_by_month = df.groupby(cols_to_group)[value].sum().reset_index()
+        calls_by_month = rollup_cube(df, cols_to_group, value).reset_index()
+        # Keep the peaks and valleys of the area within the point budget:
+        points = downsample(calls_by_month, cols_to_group, value, max_points, method=MIN_MAX)
 
         # Construct chart:
         fig4 = go.Figure(
             go.Scatter(
-                x=calls_by_month[cols_to_group],
-                y=calls_by_month[value],
+                x=points[cols_to_group],
+                y=points[value],
                 mode='lines',
                 fill='tonexty'
             )
@@ -194,31 +191,39 @@ def scatter_calls_by_month(df, cols_to_group, value):
 
 # ==================== INDICATOR: BEST SALESPERSON/CONSULTANT =========================
 
-def kpi_best_consultant(df, cols_to_group, value):
+@instrument_chart
+def kpi_best_consultant(df, cols_to_group, value, ranking=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param ranking: GroupRanking already computed for the selection (see top_k.rank_by_group).
     :return:
     """
     try:
-        # Define the dataframe:
-        best_consultant = df.groupby(cols_to_group)[value].sum(). \
-            reset_index().sort_values(by=value, ascending=False).reset_index(drop=True)
+        # Define the dataframe (the overall best is the best of the teams' tops):
+        ranking = ranking or rank_by_group(df, cols_to_group, value)
+        best_consultant = top_k(ranking.top_per_group, 1).reset_index()
+
+        # No sales within the selected dates: keep the same indicator, without a value
+        if best_consultant.empty:
+            title, best_value, reference = NO_SALES_TITLE, None, None
+        else:
+            title = (f"<span>{best_consultant[cols_to_group[0]].iloc[0]} - "
+                     f"Top Consultant ({best_consultant[cols_to_group[1]].iloc[0]})</span><br>"
+                     f"<span style='font-size: 70%'>Vendas - Em relação a média</span><br>")
+            best_value, reference = best_consultant[value].iloc[0], ranking.totals.mean()
 
         # Build the visualization:
         fig5 = go.Figure()
         fig5.add_trace(
             go.Indicator(
                 mode='number+delta',
-                title={"text": f"<span>{best_consultant[cols_to_group[0]].iloc[0]} - "
-                               f"Top Consultant ({best_consultant[cols_to_group[1]].iloc[0]})</span><br>"
-                               f"<span style='font-size: 70%'>Vendas - Em relação a média</span><br>"
-                       },
-                value=best_consultant[value].iloc[0],
+                title={"text": title},
+                value=best_value,
                 number={'prefix': "R$ "},
-                delta={'relative': True, 'valueformat': '.2%', 'reference': best_consultant[value].mean()}
+                delta={'relative': True, 'valueformat': '.2%', 'reference': reference}
             )
         )
 
@@ -231,6 +236,7 @@ def kpi_best_consultant(df, cols_to_group, value):
 
 # ========================= INDICATOR: BEST TEAM ===============================
 
+@instrument_chart
 def kpi_best_team(df, cols_to_group, value):
     """
 
@@ -241,20 +247,26 @@ def kpi_best_team(df, cols_to_group, value):
     """
     try:
         # Define the dataframe:
-        best_team = df.groupby(cols_to_group)[value].sum().reset_index(). \
-            sort_values(by=value, ascending=False)
+        sales_by_team = rollup_cube(df, cols_to_group, value)
+        best_team = top_k(sales_by_team, 1).reset_index()
+
+        # No sales within the selected dates: keep the same indicator, without a value
+        if best_team.empty:
+            title, best_value, reference = NO_SALES_TITLE, None, None
+        else:
+            title = (f"<span>{best_team[cols_to_group].iloc[0]} - Top Team"
+                     f"</span><br><span style='font-size: 70%'>Vendas - Em relação a média</span><br>")
+            best_value, reference = best_team[value].iloc[0], sales_by_team.mean()
 
         # Construct the indicator' visualization:
         fig6 = go.Figure()
         fig6.add_trace(
             go.Indicator(
                 mode='number+delta',
-                title={"text": f"<span>{best_team[cols_to_group].iloc[0]} - Top Team"
-                               f"</span><br><span style='font-size: 70%'>Vendas - Em relação a média</span><br>"
-                       },
-                value=best_team[value].iloc[0],
+                title={"text": title},
+                value=best_value,
                 number={'prefix': "R$ "},
-                delta={'relative': True, 'valueformat': '.2%', 'reference': best_team[value].mean()}
+                delta={'relative': True, 'valueformat': '.2%', 'reference': reference}
             )
         )
 
@@ -267,18 +279,23 @@ def kpi_best_team(df, cols_to_group, value):
 
 # ================ EARNINGS BY MONTH SEGREGATED BY TEAMS ======================
 
-def scatter_sales_month_teams(df, cols_to_group, value):
+@instrument_chart
+def scatter_sales_month_teams(df, cols_to_group, value, max_points=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param max_points: Maximum number of points of each line (LTTB downsampling), None draws them all.
     :return:
     """
     try:
-        # Create necessary dataframes:
-        paym_over_months_by_team = df.groupby(cols_to_group)[value].sum().reset_index()
-        payment_by_team = df.groupby(cols_to_group[0])[value].sum().reset_index()
+        # Create necessary dataframes (each team's line and the total within the point budget):
+        paym_over_months_by_team = downsample(rollup_cube(df, cols_to_group, value).reset_index(),
+                                              cols_to_group[0], value, max_points, method=LTTB,
+                                              group=cols_to_group[1])
+        payment_by_team = downsample(rollup_cube(df, cols_to_group[0], value).reset_index(),
+                                     cols_to_group[0], value, max_points, method=MIN_MAX)
 
         # Build the visualization:
         fig7 = px.line(
@@ -306,6 +323,7 @@ def scatter_sales_month_teams(df, cols_to_group, value):
 
 # ===================== TOTAL OF SALES BY TEAM ==================================
 
+@instrument_chart
 def bar_sales_by_team(df, cols_to_group, value):
     """
 
@@ -316,7 +334,7 @@ def bar_sales_by_team(df, cols_to_group, value):
     """
     try:
         # Create auxiliary dataframe:
-        sales_by_team = df.groupby(cols_to_group)[value].sum(). \
+        sales_by_team = rollup_cube(df, cols_to_group, value). \
             reset_index().sort_values(by=value, ascending=False)
 
         # Build the chart:
@@ -340,6 +358,7 @@ def bar_sales_by_team(df, cols_to_group, value):
 
 # ================ TOTAL PAYMENTS BY MARKETING CHANNEL ======================
 
+@instrument_chart
 def paym_by_channel(df, cols_to_group, value):
     """
 
@@ -350,7 +369,7 @@ def paym_by_channel(df, cols_to_group, value):
     """
     try:
         # Create dataframe:
-        paym_by_channel = df.groupby(cols_to_group)[value].sum().reset_index()
+        paym_by_channel = rollup_cube(df, cols_to_group, value).reset_index()
 
         # Construct the visualization:
         fig9 = go.Figure()  # Instantiate the figure
@@ -370,17 +389,21 @@ def paym_by_channel(df, cols_to_group, value):
 
 # ============= TOTAL PAYMENTS BY MARKETING CHANNEL OVER MONTHS ===================
 
-def paym_by_channel_over_months(df, cols_to_group, value):
+@instrument_chart
+def paym_by_channel_over_months(df, cols_to_group, value, max_points=None):
     """
 
     :param df:
     :param cols_to_group:
     :param value:
+    :param max_points: Maximum number of points of each line (LTTB downsampling), None draws them all.
     :return:
     """
     try:
-        # Create dataframe:
-        paym_over_months_by_mkt = df.groupby(cols_to_group)[value].sum().reset_index()
+        # Create dataframe (each channel's line within the point budget):
+        paym_over_months_by_mkt = downsample(rollup_cube(df, cols_to_group, value).reset_index(),
+                                             cols_to_group[1], value, max_points, method=LTTB,
+                                             group=cols_to_group[0])
 
         # Construct the visualization:
         fig10 = px.line(
@@ -398,6 +421,7 @@ def paym_by_channel_over_months(df, cols_to_group, value):
 
 # ========================= INDICATOR: TOTAL OF EARNINGS ===============================
 
+@instrument_chart
 def total_sales(df, value):
     """
 
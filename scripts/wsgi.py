@@ -0,0 +1,41 @@
+import logging
+
+import index
+from index import *
+from data_access import AggregateStore
+from snapshot import current_snapshot
+
+logger = logging.getLogger(__name__)
+
+# WSGI callable served by gunicorn (see gunicorn.conf.py):
+application = server
+
+
+def warm_up():
+    """
+    Waits for the startup and runs the callbacks of the page load once (no filter checked,
+    no date range, default theme), so the layout, the figures and the shared slices of the cube are ready in
+    the master process and inherited by every worker, instead of each worker computing them
+    on its first request. The store behind the aggregate tables is opened as well: the page load
+    is answered by the tables alone, and the store would otherwise be loaded by every worker.
+    """
+    try:
+        wait_until_ready()
+
+        store = current_snapshot().store
+        if isinstance(store, AggregateStore):
+            store.backend  # (opened on first access)
+
+        graph1_and_2([], [], [], None, None, True)
+        graph3([], [], [], [], None, None, True)
+        graph4([], [], [], None, None, True)
+        indicator1_and_2([], [], [], None, None, True)
+        graph5(index.theme_templates, True)
+        graph6([], [], [], None, None, True)
+        graph7([], [], [], [], None, None, True)
+        graph8([], [], [], None, None, True)
+        indicator3([], [], [], [], None, None, True)
+
+    except Exception as e:
+        logger.error(f"Error while warming up the callbacks: {str(e)}")
+        raise
@@ -0,0 +1,90 @@
+import csv
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+from conftest import SCRIPTS_DIR
+from data_loader import CLEAN_COLUMNS, read_columnar
+from data_preprocessing import RAW_DATASET, RAW_LAYOUT
+
+
+def raw_rows(n=3):
+    with open(os.path.join(SCRIPTS_DIR, RAW_DATASET), encoding='utf-8', newline='') as f:
+        rows = list(csv.reader(f))
+    return rows[0], rows[1:n + 1]
+
+
+def write_raw(path, header, rows):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.writer(f)
+        if header:
+            writer.writerow(header)
+        writer.writerows(rows)
+
+
+def run_cli(tmp_path, input_path):
+    """
+    Runs data_preprocessing.py as from the command line, with every output within tmp_path.
+    :return: Dict of the output paths.
+    """
+    outputs = {'output': tmp_path / 'clean.csv', 'columnar': tmp_path / 'columns', 'rejects': tmp_path / 'rejects.csv',
+               'cube': tmp_path / 'cube.csv', 'database': tmp_path / 'sales.db', 'aggregates': tmp_path / 'aggregates'}
+    args = [f"--{name}={path}" for name, path in outputs.items()]
+    result = subprocess.run([sys.executable, 'data_preprocessing.py', f"--input={input_path}", *args],
+                            cwd=SCRIPTS_DIR, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    return outputs
+
+
+def check_empty_outputs(outputs, rejected):
+    clean = pd.read_csv(outputs['output'])
+    assert list(clean.columns) == CLEAN_COLUMNS
+    assert len(clean) == 0
+    assert len(pd.read_csv(outputs['rejects'])) == rejected
+    assert len(pd.read_csv(outputs['cube'])) == 0
+    assert len(read_columnar(str(outputs['columnar']))) == 0
+
+
+def test_empty_file(tmp_path):
+    input_path = tmp_path / 'raw.csv'
+    input_path.write_bytes(b'')
+
+    check_empty_outputs(run_cli(tmp_path, input_path), rejected=0)
+
+
+def test_header_only_file(tmp_path):
+    input_path = tmp_path / 'raw.csv'
+    write_raw(input_path, RAW_LAYOUT, [])
+
+    check_empty_outputs(run_cli(tmp_path, input_path), rejected=0)
+
+
+@pytest.mark.parametrize('amount', ['7000000', 'XX 7000000', 'R$ 99999999999999999999'])
+def test_every_row_rejected(tmp_path, amount):
+    # Amounts without "R$" only are read as numbers unless the raw columns are read as text:
+    header, rows = raw_rows()
+    column = header.index('Valor Pago')
+    input_path = tmp_path / 'raw.csv'
+    write_raw(input_path, header, [row[:column] + [amount] + row[column + 1:] for row in rows])
+
+    outputs = run_cli(tmp_path, input_path)
+
+    check_empty_outputs(outputs, rejected=len(rows))
+    assert set(pd.read_csv(outputs['rejects'])['Motivo']) == {'invalid_amount'}
+
+
+def test_amounts(tmp_path):
+    header, rows = raw_rows(4)
+    column = header.index('Valor Pago')
+    amounts = ['\tR$ 5', ' R$ 0007 ', 'R$ 9223372036854775807', 'R$ 9223372036854775808']
+    input_path = tmp_path / 'raw.csv'
+    write_raw(input_path, header, [row[:column] + [amount] + row[column + 1:] for row, amount in zip(rows, amounts)])
+
+    outputs = run_cli(tmp_path, input_path)
+
+    assert pd.read_csv(outputs['output'], dtype={'Valor Pago': str})['Valor Pago'].tolist() == \
+        ['5', '7', '9223372036854775807']
+    assert pd.read_csv(outputs['rejects'])['Linha'].tolist() == [5]